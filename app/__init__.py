@@ -1,92 +1,161 @@
 import os
-import redis
+import time
+
+from .utils.startup import startup_report, readiness
+
+_import_started = time.perf_counter()
+if os.getenv('STARTUP_PROFILE_IMPORTS', 'false').lower() == 'true':
+    startup_report.start_import_tracking()
+
 import logging
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_restx import Api
-from flasgger import Swagger
-from mongoengine import connect
+from mongoengine import connect, disconnect
 from flask_cors import CORS
 
 from .dbconfigs import Config
 from .middlewares.extensions import cache, jwt, bcrypt, limiter
 from .middlewares.globalHandler import GlobalHandler
+from .middlewares.instrumentation import instrumentation
+from .utils.redis_pool import redis_pool
+from .utils.permissions import permission_registry
+from .utils.structured_logging import logging_pipeline
+from .services.hashing_service import hashing_service
+from .services.user_cache import user_cache
+from .services.token_blocklist import token_blocklist
+from .models.user import User
+from .services.user_service import UserService
+from .services.download_jobs import download_jobs
+from .services.media_cache import media_cache
+from .services.video_info import video_info
+from .services import download_service
 from app.api.auth import auth_ns
 from app.api.protected import protected_ns
 from .routes import admin_bp, register_admin_namespace
 from app.api.download import download_ns
 
-logging.basicConfig(level=logging.INFO)
+startup_report.stop_import_tracking()
+startup_report.import_seconds = time.perf_counter() - _import_started
+
 logger = logging.getLogger(__name__)
 
 def create_app():
-    app = Flask(__name__)
-    app.config.from_object(Config)
-    app.config['JWT_REFRESH_COOKIE_NAME'] = 'refresh_token_cookie'
-
-    # CORS
-    CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://localhost:5173"], "supports_credentials": True}})
-
-    # Database
-    try:
-        connect(host=app.config['MONGO_URI'])
-        logger.info("MongoDB connected.")
-    except Exception as e:
-        logger.error(f"MongoDB connection failed: {e}", exc_info=True)
-        raise
-
-    # Redis
-    try:
-        redis_client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'], decode_responses=True)
-        redis_client.ping()
-        app.config['SESSION_REDIS'] = redis_client
-        logger.info("Redis connected.")
-    except redis.exceptions.ConnectionError as e:
-        logger.error(f"Redis connection failed: {e}", exc_info=True)
-        app.config['CACHE_TYPE'] = 'null'
+    startup_report.reset()
+    with startup_report.step('config'):
+        Config.validate()
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        logging_pipeline.init_app(app)
+        app.config['JWT_REFRESH_COOKIE_NAME'] = 'refresh_token_cookie'
+
+        # Client address from the reverse proxy, for per-IP rate limits and login lockouts
+        if app.config['PROXY_FIX_X_FOR'] or app.config['PROXY_FIX_X_PROTO']:
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'],
+                                    x_proto=app.config['PROXY_FIX_X_PROTO'])
+
+        # CORS
+        CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://localhost:5173"], "supports_credentials": True}})
+
+        # Instrumentation: registers the Mongo command listener, so before connecting
+        instrumentation.init_app(app)
+        readiness.init_app(app)
+
+    # Database: the client connects on first use, so a slow Mongo cannot hold up boot
+    with startup_report.step('mongo'):
+        connect(host=app.config['MONGO_URI'], connect=False)
+
+    # Redis: one pool shared by the cache, the limiter and sessions; connections open on first use
+    with startup_report.step('redis'):
+        redis_pool.init_app(app)
+        app.config['SESSION_REDIS'] = redis_pool.client
+        app.config['CACHE_REDIS_HOST'] = redis_pool.client
+        app.config['CACHE_REDIS_URL'] = None  # Would make Flask-Caching open its own pool
+        if 'redis' in app.config['RATELIMIT_STORAGE_URI'].split('://')[0]:
+            app.config['RATELIMIT_STORAGE_OPTIONS'] = dict(app.config['RATELIMIT_STORAGE_OPTIONS'], connection_pool=redis_pool.pool)
 
     # Extensions
-    cache.init_app(app)
-    jwt.init_app(app)
-    bcrypt.init_app(app)
-    limiter.init_app(app)
+    with startup_report.step('extensions'):
+        cache.init_app(app)
+        jwt.init_app(app)
+        permission_registry.init_app(app)
+        bcrypt.init_app(app)
+        limiter.init_app(app)
+        hashing_service.init_app(app)
+        user_cache.init_app(app)
+        token_blocklist.init_app(app)
+        os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
+        download_service.init_app(app)
+        download_jobs.init_app(app)
+        video_info.init_app(app)
+        media_cache.init_app(app)
 
     # API with global /api prefix
-    authorizations = {
-        'BearerAuth': {
-            'type': 'apiKey',
-            'in': 'header',
-            'name': 'Authorization',
-            'description': 'Bearer <JWT token>'
+    with startup_report.step('routes'):
+        authorizations = {
+            'BearerAuth': {
+                'type': 'apiKey',
+                'in': 'header',
+                'name': 'Authorization',
+                'description': 'Bearer <JWT token>'
+            }
         }
-    }
-
-    api = Api(
-        app,
-        doc='/docs/',
-        title='Flask JWT API',
-        version='1.0',
-        description='A scalable API with JWT, MongoDB, Redis',
-        authorizations=authorizations,
-        security='BearerAuth',
-        prefix='/api'  # Apply to all routes
-    )
-
-    # Register
-    api.add_namespace(auth_ns, path='/auth')
-    api.add_namespace(protected_ns, path='/protected')
-    app.register_blueprint(admin_bp, url_prefix='/api/admin')
-    api.add_namespace(download_ns, path="/video")
-    register_admin_namespace(api)
-
-    # Flasgger Swagger
-    swagger_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'swagger.yml')
-    if os.path.exists(swagger_path):
-        Swagger(app, template_file=swagger_path)
-
-    # Global Handler
-    try:
-        app.config.from_object(GlobalHandler)
-    except Exception as e:
-        logger.error(f"Failed to load GlobalHandler: {e}", exc_info=True)
 
+        api = Api(
+            app,
+            doc='/docs/',
+            title='Flask JWT API',
+            version='1.0',
+            description='A scalable API with JWT, MongoDB, Redis',
+            authorizations=authorizations,
+            security='BearerAuth',
+            prefix='/api'  # Apply to all routes
+        )
+
+        # Register
+        api.add_namespace(auth_ns, path='/auth')
+        api.add_namespace(protected_ns, path='/protected')
+        app.register_blueprint(admin_bp, url_prefix='/api/admin')
+        api.add_namespace(download_ns, path="/video")
+        register_admin_namespace(api)
+
+        # Flasgger Swagger, imported only when there is a spec to serve
+        swagger_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'swagger.yml')
+        if os.path.exists(swagger_path):
+            from flasgger import Swagger
+            Swagger(app, template_file=swagger_path)
+
+        # Global Handler
+        try:
+            app.config.from_object(GlobalHandler)
+        except Exception as e:
+            logger.error("Failed to load GlobalHandler: %s", e, exc_info=True)
+
+    # Everything that talks to Mongo or Redis at startup runs in the background; see /readyz
+    readiness.add_task('redis', redis_pool.client.ping)
+    readiness.add_task('mongo', lambda: User._get_db().command('ping'))
+    # The Bloom filter is built from the normalized fields, so only once migrate has backfilled them
+    readiness.add_task('user indexes', User.migrate)
+    readiness.add_task('user bloom filter', lambda: user_cache.load_known(UserService.iter_known_identifiers))
+    readiness.add_task('token blocklist', token_blocklist.load)
+    if app.config.get('STARTUP_PRELOAD_YT_DLP', True):
+        readiness.add_task('yt_dlp import', lambda: __import__('yt_dlp'), required=False)
+    if not app.config['STARTUP_DEFER_TASKS']:
+        readiness.start()
+
+    startup_report.log()
     return app
+
+
+def reinit_after_fork(app):
+    """
+    Give a worker forked from a preloaded app its own connections: a fresh
+    Mongo client, an empty Redis pool, and startup tasks rerun so Bloom
+    filters and pub/sub listeners belong to this process. Call from the
+    server's post_fork hook.
+    """
+    disconnect()
+    connect(host=app.config['MONGO_URI'], connect=False)
+    redis_pool.reset()
+    readiness.reset()
+    readiness.start()
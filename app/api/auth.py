@@ -1,15 +1,19 @@
 from flask_restx import Namespace, Resource, fields
-from flask import request, jsonify, make_response
-from ..services.user_service import UserService
+from flask import current_app, request, jsonify, make_response
+from ..services.user_service import UserService, LoginLockedError
+from ..services.token_blocklist import token_blocklist
+from ..services.token_service import rotate, end_session, claims_are_stale, RefreshTokenError
 from ..utils.security import generate_tokens
 from flask_jwt_extended import (
     jwt_required,
+    get_jwt,
     get_jwt_identity,
-    create_access_token,
+    decode_token,
     set_refresh_cookies,
     unset_jwt_cookies,
 )
 from app.middlewares.extensions import limiter
+from flask_limiter.util import get_remote_address
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,8 +28,7 @@ login_model = auth_ns.model('Login', {
 register_model = auth_ns.model('Register', {
     'username': fields.String(required=True, example='user1'),
     'email': fields.String(required=True, example='user1@example.com'),
-    'password': fields.String(required=True, example='Pass123!'),
-    'role': fields.String(example='user', default='user')
+    'password': fields.String(required=True, example='Pass123!')
 })
 
 def create_auth_response(access_token, refresh_token, user, status_code=200):
@@ -55,12 +58,15 @@ class Login(Resource):
         if not identifier or not password:
             auth_ns.abort(400, message="Identifier and password required")
 
-        user = UserService.authenticate(identifier, password)
+        try:
+            user = UserService.authenticate(identifier, password, ip=get_remote_address())
+        except LoginLockedError as e:
+            return {'message': e.description}, 429, {'Retry-After': str(e.retry_after)}
         if not user:
             auth_ns.abort(401, message="Invalid credentials")
 
         access_token, refresh_token = generate_tokens(user)
-        logger.info(f"User logged in: {identifier}")
+        logger.info("User logged in: %s", identifier)
 
         return create_auth_response(access_token, refresh_token, user)
 
@@ -73,14 +79,16 @@ class Register(Resource):
         username = data.get('username')
         email = data.get('email')
         password = data.get('password')
-        role = data.get('role', 'user')
 
         if not username or not email or not password:
             auth_ns.abort(400, message="Username, email, and password required")
+        if data.get('role', 'user') != 'user':
+            # Roles grant permissions, so only admins may assign them
+            auth_ns.abort(400, message="Role cannot be chosen at registration")
 
-        user = UserService.create_user(username, email, password, role)
+        user = UserService.create_user(username, email, password)
         access_token, refresh_token = generate_tokens(user)
-        logger.info(f"User registered: {username} ({email})")
+        logger.info("User registered: %s (%s)", username, email)
 
         return create_auth_response(access_token, refresh_token, user, status_code=201)
 
@@ -89,33 +97,36 @@ class Refresh(Resource):
     @jwt_required(refresh=True)
     def post(self):
         current_user = get_jwt_identity()
-        user = UserService.get_user_by_username_or_email(current_user)
-        if not user:
-            auth_ns.abort(401, message="User not found")
-
-        new_access_token = create_access_token(identity=current_user, additional_claims={'role': user.role})
-        new_refresh_token, _ = generate_tokens(user)
+        try:
+            access_token, refresh_token, user = rotate(current_user, get_jwt())
+        except RefreshTokenError as e:
+            auth_ns.abort(401, message=str(e))
 
-        logger.info(f"Tokens refreshed for user: {current_user}")
-        return create_auth_response(new_access_token, new_refresh_token, user)
+        logger.info("Tokens refreshed for user: %s", current_user)
+        return create_auth_response(access_token, refresh_token, user)
 
 @auth_ns.route('/me')
 class Me(Resource):
     @jwt_required()
     def get(self):
-        current_user = get_jwt_identity()
-        user = UserService.get_user_by_username_or_email(current_user)
-        if not user:
-            auth_ns.abort(404, message="User not found")
-        return {
-            "username": user.username,
-            "email": user.email,
-        }, 200
+        claims = get_jwt()
+        profile = {name: claims.get(name) for name in current_app.config.get('JWT_PROFILE_CLAIMS', ())}
+        if claims_are_stale(claims) or None in profile.values():
+            # Issued before a role or profile change, or before these claims existed
+            auth_ns.abort(401, message="Token claims are stale, please refresh")
+        return dict(profile, username=get_jwt_identity()), 200
 
 @auth_ns.route('/logout')
 class Logout(Resource):
     @jwt_required(refresh=True)
     def post(self):
+        end_session(get_jwt())
+        access_token = request.cookies.get('access_token_cookie')
+        if access_token:
+            try:
+                token_blocklist.revoke(decode_token(access_token))
+            except Exception:
+                pass  # Expired or invalid, so unusable anyway
         resp = make_response(jsonify({"msg": "Logged out"}), 200)
         unset_jwt_cookies(resp)  # Clear access and refresh cookies
         return resp
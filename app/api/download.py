@@ -1,20 +1,171 @@
-from flask import request, send_file
-from flask_restx import Namespace, Resource
-import yt_dlp
+from flask import request, current_app, Response
+from flask_restx import Namespace, Resource, fields
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_limiter.util import get_remote_address
+from urllib.parse import quote
+import json
+import logging
 import os
-import zipfile
+import shutil
 import tempfile
 
+from ..services import download_service
+from ..utils.zipstream import ZipStream
+from ..utils.media import serve_media
+from ..services.download_jobs import download_jobs, JobLimitError, FINISHED
+from ..services.media_cache import media_cache
+from ..services.video_info import video_info
+
+logger = logging.getLogger(__name__)
+
 download_ns = Namespace("video", description="Video operations")
 
-DOWNLOAD_FOLDER = os.path.join(os.getcwd(), "downloads")
-os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+job_request_model = download_ns.model('DownloadJobRequest', {
+    'url': fields.String(required=True, description='Video, playlist or channel URL')
+})
+
+job_model = download_ns.model('DownloadJob', {
+    'id': fields.String(description='Job id'),
+    'kind': fields.String(description='video, playlist or channel'),
+    'url': fields.String(description='Requested URL'),
+    'status': fields.String(description='queued, running, finished, failed or cancelled'),
+    'progress': fields.Float(description='Completion percentage'),
+    'downloaded_bytes': fields.Integer(description='Bytes downloaded for the current entry'),
+    'total_bytes': fields.Integer(description='Expected bytes for the current entry'),
+    'entries_done': fields.Integer(description='Finished playlist entries'),
+    'entries_total': fields.Integer(description='Total playlist entries'),
+    'entries_failed': fields.Integer(description='Playlist entries that could not be downloaded'),
+    'failures': fields.Raw(description='Per-entry failure reasons for a partial result'),
+    'filename': fields.String(description='Result file name once finished'),
+    'error': fields.String(description='Failure reason'),
+    'created_at': fields.Float(description='Unix time the job was queued'),
+    'updated_at': fields.Float(description='Unix time of the last state change')
+})
+
+
+def current_owner():
+    """Jobs belong to the JWT identity when one is presented, otherwise to the client address."""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f"user:{identity}" if identity else f"ip:{get_remote_address()}"
+
+
+def submit_job(kind):
+    if not download_jobs.available:
+        return {"error": "Download jobs are unavailable"}, 503
+    url = (request.get_json(silent=True) or {}).get("url") or request.args.get("url")
+    if not url:
+        return {"error": "Missing URL"}, 400
+    try:
+        job_id = download_jobs.submit(current_owner(), kind, url)
+    except JobLimitError as e:
+        return {"error": str(e)}, 429
+    api = download_ns.apis[0]
+    return {
+        "job_id": job_id,
+        "status_url": api.url_for(DownloadJob, job_id=job_id),
+        "result_url": api.url_for(DownloadJobResult, job_id=job_id),
+    }, 202
+
+
+def attachment_header(filename):
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def use_parallel_entries():
+    flag = request.args.get("parallel")
+    if flag is None:
+        return current_app.config.get('DOWNLOAD_PARALLEL_ENTRIES', True)
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def stream_collection_zip(url, default_name, empty_message):
+    """
+    Respond with a ZIP that grows as yt-dlp finishes each entry.
+
+    Entries are stored uncompressed and deleted once streamed; no archive is
+    ever written to disk. In parallel mode entries are downloaded concurrently
+    and, if some of them fail, a ``download_report.json`` listing the failures
+    is appended to the archive.
+    """
+    info = download_service.extract_collection(url)
+    if not info.get('entries'):
+        return {"error": empty_message}, 400
+
+    temp_dir = tempfile.mkdtemp(prefix='zipstream-')
+    parallel = use_parallel_entries()
+    settings = download_service.parallel_settings(current_app.config)
+
+    def generate():
+        archive = ZipStream()
+        failures = []
+        downloads = None
+        try:
+            if parallel:
+                downloads = results = download_service.iter_parallel_downloads(info['entries'], temp_dir, **settings)
+            else:
+                downloads = download_service.iter_collection_downloads(info, temp_dir)
+                results = (download_service.EntryResult(None, None, None, path, None) for path in downloads)
+            for result in results:
+                if result.error:
+                    failures.append({'index': result.index, 'title': result.title,
+                                     'url': result.url, 'error': result.error})
+                    continue
+                if not os.path.exists(result.path):
+                    continue
+                yield from archive.add_file(result.path, download_service.entry_arcname(result) if parallel else None)
+                os.remove(result.path)
+            if failures:
+                report = {'failed': sorted(failures, key=lambda f: f['index'])}
+                yield from archive.add_bytes('download_report.json', json.dumps(report, indent=2).encode('utf-8'))
+            yield from archive.close()
+        finally:
+            if downloads is not None:
+                # Stop the downloads, and wait for them, before their directory goes
+                downloads.close()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    zip_name = f"{info.get('title') or default_name}.zip"
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': attachment_header(zip_name)},
+        direct_passthrough=True,
+    )
+
+
+def get_owned_job(job_id):
+    if not download_jobs.available:
+        download_ns.abort(503, "Download jobs are unavailable")
+    job = download_jobs.get(job_id)
+    if not job or job['owner'] != current_owner():
+        download_ns.abort(404, "Job not found")
+    return job
+
 
-def create_zip_from_files(zip_path, file_paths):
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for file_path in file_paths:
-            if os.path.exists(file_path):
-                zipf.write(file_path, arcname=os.path.basename(file_path))
+@download_ns.route('/info')
+class VideoInfo(Resource):
+    @download_ns.doc(params={'url': 'Video, playlist or channel URL',
+                             'playlist': 'Set to 0 to resolve a video URL that names a playlist to just the video'},
+                     responses={200: 'Metadata', 400: 'Missing URL', 422: 'Nothing could be extracted'})
+    def get(self):
+        """Title, duration, formats or a playlist's entries, without downloading any media."""
+        url = request.args.get("url")
+        if not url:
+            return {"error": "Missing URL"}, 400
+        playlist = request.args.get("playlist", "1").lower() in ('1', 'true', 'yes')
+
+        try:
+            info = video_info.get(url, playlist=playlist)
+        except Exception as e:
+            return {"error": f"Failed to extract video info: {str(e)}"}, 500
+        if not info:
+            return {"error": "No video information could be extracted from this URL"}, 422
+        return info, 200
 
 
 @download_ns.route('/download-video')
@@ -24,27 +175,26 @@ class DownloadSingleVideo(Resource):
         if not url:
             return {"error": "Missing URL"}, 400
 
-        ydl_opts = {
-            'format': 'best',
-            'outtmpl': os.path.join(DOWNLOAD_FOLDER, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'noplaylist': True,  # Only single video
-            'ignoreerrors': True,
-        }
-
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                video_path = ydl.prepare_filename(info)
-                return send_file(
-                    video_path,
-                    as_attachment=True,
-                    download_name=os.path.basename(video_path)
-                )
+            for attempt in range(2):
+                video_path = media_cache.get_or_download(url, request.args.get("format") or 'best')
+                if not video_path:
+                    return {"error": "Failed to download video: nothing was downloaded"}, 500
+                try:
+                    return serve_media(video_path)
+                except FileNotFoundError:
+                    # Evicted between lookup and serving: a cache miss, so fetch it again
+                    if attempt:
+                        raise
         except Exception as e:
             return {"error": f"Failed to download video: {str(e)}"}, 500
 
+    @download_ns.expect(job_request_model)
+    @download_ns.doc(responses={202: 'Job queued', 400: 'Missing URL', 429: 'Too many active jobs'})
+    def post(self):
+        """Queue a single-video download job."""
+        return submit_job('video')
+
 
 @download_ns.route('/download-playlist')
 class DownloadPlaylist(Resource):
@@ -53,43 +203,16 @@ class DownloadPlaylist(Resource):
         if not url:
             return {"error": "Missing URL"}, 400
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            ydl_opts = {
-                'format': 'best',
-                'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-                'quiet': True,
-                'no_warnings': True,
-                'ignoreerrors': True,
-                'noplaylist': False,  # Enable playlist download
-            }
-
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    entries = info.get('entries')
-
-                    if not entries:
-                        return {"error": "URL does not contain a playlist"}, 400
-
-                    file_paths = []
-                    for entry in entries:
-                        if entry is None:
-                            continue
-                        filename = ydl.prepare_filename(entry)
-                        file_paths.append(filename)
-
-                    zip_name = f"{info.get('title', 'playlist')}.zip"
-                    zip_path = os.path.join(DOWNLOAD_FOLDER, zip_name)
-                    create_zip_from_files(zip_path, file_paths)
-
-                    return send_file(
-                        zip_path,
-                        as_attachment=True,
-                        download_name=zip_name,
-                        mimetype='application/zip'
-                    )
-            except Exception as e:
-                return {"error": f"Failed to download playlist: {str(e)}"}, 500
+        try:
+            return stream_collection_zip(url, 'playlist', "URL does not contain a playlist")
+        except Exception as e:
+            return {"error": f"Failed to download playlist: {str(e)}"}, 500
+
+    @download_ns.expect(job_request_model)
+    @download_ns.doc(responses={202: 'Job queued', 400: 'Missing URL', 429: 'Too many active jobs'})
+    def post(self):
+        """Queue a playlist download job."""
+        return submit_job('playlist')
 
 
 @download_ns.route('/download-channel')
@@ -99,41 +222,47 @@ class DownloadChannel(Resource):
         if not url:
             return {"error": "Missing URL"}, 400
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            ydl_opts = {
-                'format': 'best',
-                'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-                'quiet': True,
-                'no_warnings': True,
-                'ignoreerrors': True,
-                'noplaylist': False,  # Must allow multiple downloads
-                # 'playliststart': 1, # Optionally limit downloads
-            }
-
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    entries = info.get('entries')
-
-                    if not entries:
-                        return {"error": "URL does not contain channel videos"}, 400
-
-                    file_paths = []
-                    for entry in entries:
-                        if entry is None:
-                            continue
-                        filename = ydl.prepare_filename(entry)
-                        file_paths.append(filename)
-
-                    zip_name = f"{info.get('title', 'channel')}.zip"
-                    zip_path = os.path.join(DOWNLOAD_FOLDER, zip_name)
-                    create_zip_from_files(zip_path, file_paths)
-
-                    return send_file(
-                        zip_path,
-                        as_attachment=True,
-                        download_name=zip_name,
-                        mimetype='application/zip'
-                    )
-            except Exception as e:
-                return {"error": f"Failed to download channel videos: {str(e)}"}, 500
+        try:
+            return stream_collection_zip(url, 'channel', "URL does not contain channel videos")
+        except Exception as e:
+            return {"error": f"Failed to download channel videos: {str(e)}"}, 500
+
+    @download_ns.expect(job_request_model)
+    @download_ns.doc(responses={202: 'Job queued', 400: 'Missing URL', 429: 'Too many active jobs'})
+    def post(self):
+        """Queue a channel download job."""
+        return submit_job('channel')
+
+
+@download_ns.route('/jobs/<string:job_id>')
+class DownloadJob(Resource):
+    @download_ns.marshal_with(job_model)
+    @download_ns.doc(responses={200: 'Job status', 404: 'Job not found'})
+    def get(self, job_id):
+        """Status and progress of a download job."""
+        return get_owned_job(job_id), 200
+
+    @download_ns.doc(responses={202: 'Cancellation requested', 404: 'Job not found'})
+    def delete(self, job_id):
+        """Cancel a queued or running download job."""
+        get_owned_job(job_id)
+        download_jobs.cancel(job_id)
+        return {"job_id": job_id, "message": "Cancellation requested"}, 202
+
+
+@download_ns.route('/jobs/<string:job_id>/result')
+class DownloadJobResult(Resource):
+    @download_ns.doc(responses={200: 'Downloaded file', 206: 'Partial content', 304: 'Not modified',
+                                404: 'Job not found', 409: 'Job not finished'})
+    def get(self, job_id):
+        """Download the file produced by a finished job."""
+        job = get_owned_job(job_id)
+        if job['status'] != FINISHED:
+            return {"error": f"Job is {job['status']}"}, 409
+        result_path = job.get('result_path')
+        if not result_path:
+            return {"error": "Result is no longer available"}, 410
+        try:
+            return serve_media(result_path, job.get('filename'))
+        except FileNotFoundError:
+            return {"error": "Result is no longer available"}, 410
@@ -1,7 +1,7 @@
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from flask import request
-from ..utils.security import role_required
+from ..utils.security import permissions_required
+from ..utils.permissions import Permission
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,7 +31,6 @@ class ProtectedResource(Resource):
     def get(self):
         """Retrieve protected resource for authenticated users."""
         try:
-            logger.info("Authorization header: %s", request.headers.get("Authorization"))
             claims = get_jwt()
             user_identity = get_jwt_identity()
             if not user_identity:
@@ -43,13 +42,12 @@ class ProtectedResource(Resource):
                 'message': 'Access granted'
             }, 200
         except Exception as e:
-            logger.error(f"Error in ProtectedResource: {str(e)}", exc_info=True)
+            logger.error("Error in ProtectedResource: %s", e, exc_info=True)
             protected_ns.abort(500, message=f"Internal server error: {str(e)}")
 
 @protected_ns.route('/admin')
 class AdminResource(Resource):
-    @jwt_required()
-    @role_required('admin')
+    @permissions_required(all_of=[Permission.ADMIN_ACCESS])
     @protected_ns.marshal_with(admin_model)
     @protected_ns.doc(security='BearerAuth', responses={
         200: 'Success',
@@ -60,8 +58,7 @@ class AdminResource(Resource):
     def get(self):
         """Retrieve admin resource for users with admin role."""
         try:
-            logger.info("Authorization header: %s", request.headers.get("Authorization"))
             return {'message': 'Admin access granted'}, 200
         except Exception as e:
-            logger.error(f"Error in AdminResource: {str(e)}", exc_info=True)
+            logger.error("Error in AdminResource: %s", e, exc_info=True)
             protected_ns.abort(500, message=f"Internal server error: {str(e)}")
\ No newline at end of file
@@ -9,7 +9,48 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'default-secret-key')  # Fallback for development
 
+    # Reverse proxy: trusted proxies in front of the app, whose X-Forwarded-* headers give the client's
+    # address for rate limits and login lockouts. Leave at 0 unless a proxy always sets them.
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
+    PROXY_FIX_X_PROTO = int(os.getenv('PROXY_FIX_X_PROTO', 0))
+
     RATELIMIT_DEFAULT = "100 per minute"
+    # Only the scheme matters: connections come from the shared Redis pool. hybrid+ adds a local pre-filter
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'hybrid+redis://')
+    RATELIMIT_HYBRID_SYNC_INTERVAL = 0.5  # Seconds between batched syncs of locally admitted hits
+    RATELIMIT_HYBRID_LOCAL_SHARE = 0.5  # Share of the remaining window a process may admit between syncs
+    RATELIMIT_HYBRID_MARGIN = 0.1  # Within this fraction of the limit every hit is checked in Redis
+    RATELIMIT_HYBRID_WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))  # Processes sharing the limits; splits the local budget
+    RATELIMIT_HYBRID_MIN_LIMIT = 10  # Limits below this are always checked in Redis; the defaults and login limits share out
+    RATELIMIT_STORAGE_OPTIONS = {
+        'hybrid_sync_interval': RATELIMIT_HYBRID_SYNC_INTERVAL,
+        'hybrid_local_share': RATELIMIT_HYBRID_LOCAL_SHARE,
+        'hybrid_margin': RATELIMIT_HYBRID_MARGIN,
+        'hybrid_workers': RATELIMIT_HYBRID_WORKERS,
+        'hybrid_min_limit': RATELIMIT_HYBRID_MIN_LIMIT,
+    } if RATELIMIT_STORAGE_URI.startswith('hybrid+') else {}
+
+    # Startup: connections and cache warm-up happen in the background, see /readyz
+    STARTUP_GATE_REQUESTS = os.getenv('STARTUP_GATE_REQUESTS', 'false').lower() == 'true'  # 503 until ready
+    STARTUP_RETRY_INTERVAL = 2  # Seconds between attempts of a failed startup task
+    STARTUP_DEFER_TASKS = os.getenv('STARTUP_DEFER_TASKS', 'false').lower() == 'true'  # Leave them to each forked worker
+    STARTUP_PRELOAD_YT_DLP = True  # Import yt_dlp in the background rather than on the first download
+
+    # Logging: records are queued and written as JSON lines by a background thread
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+    LOG_SAMPLE_RATES = {  # Share of sub-WARNING records kept per logger (and its children)
+        'app.utils.security': 0.1,
+        'app.api.protected': 0.1,
+    }
+
+    # Instrumentation: Server-Timing header and Prometheus /metrics
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'true').lower() == 'true'
+    METRICS_PATH = '/metrics'
+    METRICS_DIR = os.getenv('METRICS_DIR')  # Shared by all workers; without it /metrics covers one process
+    METRICS_FLUSH_INTERVAL = 5  # Seconds between writes of a worker's aggregates to METRICS_DIR
+    METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
     # Database and Cache URLs with Docker-friendly fallbacks
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://mongo:27017/flask_api')
@@ -23,21 +64,88 @@ class Config:
     JWT_COOKIE_CSRF_PROTECT = False  # Disable CSRF for simplicity (enable in production)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)  # Short-lived access token
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=7)    # Long-lived refresh token
+    JWT_CLAIMS_CACHE_ENABLED = os.getenv('JWT_CLAIMS_CACHE_ENABLED', 'false').lower() == 'true'  # Skip re-verifying hot tokens
+    JWT_CLAIMS_CACHE_SIZE = 10000  # Verified tokens remembered per process
+    JWT_CLAIMS_CACHE_MAX_TTL = 300  # Upper bound on how long claims are reused, whatever the token's exp
+    JWT_BLOCKLIST_CHANNEL = 'token_blocklist:revoked'
+    JWT_BLOCKLIST_BLOOM_CAPACITY = int(os.getenv('JWT_BLOCKLIST_BLOOM_CAPACITY', 100_000))  # Revoked tokens alive at once
+    JWT_BLOCKLIST_BLOOM_ERROR_RATE = 0.001
+    JWT_BLOCKLIST_REBUILD_INTERVAL = 3600  # Also drops JTIs whose tokens have expired
+    JWT_PROFILE_CLAIMS = ['email']  # User fields embedded in access tokens and served by /auth/me
+    ROLE_PERMISSIONS = {  # Compiled into bitmasks at startup; '*' grants everything
+        'user': [],
+        'admin': ['*'],
+    }
+    JWT_REFRESH_REUSE_GRACE = 10  # Seconds a just-rotated refresh token is refused without revoking its family
+    JWT_REFRESH_RETRY_AFTER = 1  # Seconds, sent with 503 when Redis cannot rotate a refresh token
+
+    # Redis Connection Pool (shared by the cache, limiter, sessions and services)
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 20))  # Per worker process
+    REDIS_POOL_TIMEOUT = 2  # Seconds to wait for a free connection before failing
+    REDIS_SOCKET_TIMEOUT = 2
+    REDIS_SOCKET_CONNECT_TIMEOUT = 2
+    REDIS_HEALTH_CHECK_INTERVAL = 30  # Ping connections idle longer than this before reuse
 
     # Cache Configuration
     CACHE_TYPE = 'RedisCache'
-    CACHE_REDIS_CONFIG = {
-        'URL': os.getenv('REDIS_URL', 'redis://redis:6379/0'),  # Use URL directly
-        'CONNECTION_POOL_KWARGS': {'max_connections': 10}
-    }
     CACHE_DEFAULT_TIMEOUT = 300
     CACHE_KEY_PREFIX = 'flask_cache_'
 
+    # User Lookup Cache (per-process LRU in front of Redis)
+    USER_CACHE_TTL = 300
+    USER_CACHE_LOCAL_TTL = 30
+    USER_CACHE_LOCAL_SIZE = 1024
+    USER_CACHE_CHANNEL = 'user_cache:invalidate'
+    USER_NEGATIVE_TTL = 60  # How long an unknown identifier is remembered as missing
+    USER_BLOOM_CAPACITY = int(os.getenv('USER_BLOOM_CAPACITY', 1_000_000))
+    USER_BLOOM_ERROR_RATE = 0.01
+    USER_BLOOM_REBUILD_INTERVAL = 3600
+    USER_VERSION_TTL = int(JWT_ACCESS_TOKEN_EXPIRES.total_seconds())  # Stale claims cannot outlive the access token
+    USER_VERSION_LOCAL_SIZE = 10000
+
+    # Login Attempt Tracking
+    LOGIN_MAX_ATTEMPTS = 5  # Per identifier within the window
+    LOGIN_MAX_ATTEMPTS_PER_IP = 100  # Per client IP within the window
+    LOGIN_ATTEMPT_WINDOW = 3600  # Seconds
+    LOGIN_ATTEMPT_SLIDING = os.getenv('LOGIN_ATTEMPT_SLIDING', 'false').lower() == 'true'
+
+    # Video Downloads
+    DOWNLOAD_FOLDER = os.getenv('DOWNLOAD_FOLDER', os.path.join(os.getcwd(), 'downloads'))
+    DOWNLOAD_JOB_WORKERS = int(os.getenv('DOWNLOAD_JOB_WORKERS', 2))  # Download threads per process
+    DOWNLOAD_JOB_USER_LIMIT = 2  # Queued or running jobs per user
+    DOWNLOAD_JOB_TTL = 86400  # Seconds a job record is kept
+    DOWNLOAD_JOB_HEARTBEAT = 15  # Seconds between heartbeats of the jobs a process holds
+    DOWNLOAD_JOB_STALE_AFTER = 60  # A job without a heartbeat this long belonged to a dead worker
+    DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv('DOWNLOAD_CACHE_MAX_BYTES', 5 * 1024 ** 3))  # Disk quota for cached media
+    DOWNLOAD_CACHE_JANITOR_INTERVAL = 300  # Seconds between eviction sweeps
+    DOWNLOAD_CACHE_LOCK_TTL = 900  # Longest a single download may hold its single-flight lock
+    DOWNLOAD_CACHE_PIN_SECONDS = 60  # Entries used this recently are never evicted, so they can still be served
+    DOWNLOAD_PARALLEL_ENTRIES = os.getenv('DOWNLOAD_PARALLEL_ENTRIES', 'true').lower() == 'true'
+    DOWNLOAD_PLAYLIST_CONCURRENCY = int(os.getenv('DOWNLOAD_PLAYLIST_CONCURRENCY', 4))  # Entries downloaded at once per playlist
+    DOWNLOAD_ENTRY_RETRIES = 2  # Extra attempts for a failed playlist entry
+    DOWNLOAD_JOB_BANDWIDTH = int(os.getenv('DOWNLOAD_JOB_BANDWIDTH', 0))  # Bytes/s per playlist, 0 = unlimited
+    DOWNLOAD_GLOBAL_BANDWIDTH = int(os.getenv('DOWNLOAD_GLOBAL_BANDWIDTH', 0))  # Bytes/s per process, 0 = unlimited
+    VIDEO_INFO_TTL = 600  # Seconds extracted metadata is cached in Redis
+    VIDEO_INFO_LOCAL_SIZE = 256
+    VIDEO_INFO_LOCAL_TTL = 60
+
+    # Media Serving
+    MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '')  # '', 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd)
+    MEDIA_OFFLOAD_PREFIX = os.getenv('MEDIA_OFFLOAD_PREFIX', '/protected-media/')  # Internal location aliased to DOWNLOAD_FOLDER
+    MEDIA_MAX_AGE = 0  # Seconds clients may cache media without revalidating
+
+    # Password Hashing Pool
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # 0 runs hashes inline
+    PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 16))
+    PASSWORD_HASH_RETRY_AFTER = 1  # Seconds, sent with 503 when the queue is full
+    PASSWORD_HASH_TIMEOUT = 10
+    PASSWORD_HASH_SCHEME = os.getenv('PASSWORD_HASH_SCHEME', 'scrypt')  # scrypt, bcrypt, pbkdf2 or argon2
+    PASSWORD_HASH_PARAMS = None  # Explicit cost parameters, used when no budget is set
+    PASSWORD_HASH_BUDGET_MS = int(os.getenv('PASSWORD_HASH_BUDGET_MS', 0))  # Calibrate cost at startup when > 0
+
     # Validate required environment variables
     @classmethod
     def validate(cls):
         if not cls.SECRET_KEY or not cls.JWT_SECRET_KEY:
             raise ValueError("SECRET_KEY and JWT_SECRET_KEY must be set in environment variables")
-
-# Validate configuration on import
-Config.validate()
\ No newline at end of file
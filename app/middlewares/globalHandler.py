@@ -1,22 +1,24 @@
 from flask_restx import Api
 from flask_jwt_extended import JWTManager
 from flask import jsonify
-import traceback
-import sys
+import logging
 from werkzeug.exceptions import TooManyRequests  # Import for 429
 
+logger = logging.getLogger(__name__)
+
 api = Api()
 jwt = JWTManager()
 
 class GlobalHandler:
     @api.errorhandler(Exception)
     def handle_error(error):
-        print("Error type:", type(error), file=sys.stderr)
-        traceback.print_exc()
+        code = getattr(error, 'code', 500)
+        if code >= 500:
+            logger.exception("Unhandled %s", type(error).__name__)
         msg = str(error)
         if not msg or msg.startswith('<'):
             msg = "Internal Server Error"
-        return {'message': msg}, getattr(error, 'code', 500)
+        return {'message': msg}, code
 
     @api.errorhandler(TooManyRequests)
     def handle_too_many_requests(error):
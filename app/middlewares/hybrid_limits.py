@@ -0,0 +1,226 @@
+import logging
+import math
+import os
+import threading
+import time
+
+from limits.storage import RedisStorage
+
+from ..utils.timing import timed
+from ..utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# KEYS: moving-window list. ARGV: timestamp, limit, expiry, locally admitted hits to record, hits to acquire now.
+# Returns {acquired, entries in the current window}.
+SYNC_SCRIPT = """
+local timestamp = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local expiry = tonumber(ARGV[3])
+local pending = tonumber(ARGV[4])
+local amount = tonumber(ARGV[5])
+
+-- Hits already admitted locally are recorded unconditionally
+for i = 1, pending, 5000 do
+    local entries = {}
+    for j = i, math.min(i + 4999, pending) do
+        entries[#entries + 1] = timestamp
+    end
+    redis.call('lpush', KEYS[1], unpack(entries))
+end
+
+local acquired = 0
+if amount > 0 and amount <= limit then
+    local entry = redis.call('lindex', KEYS[1], limit - amount)
+    if not (entry and tonumber(entry) >= timestamp - expiry) then
+        for i = 1, amount do
+            redis.call('lpush', KEYS[1], timestamp)
+        end
+        acquired = 1
+    end
+end
+
+if pending > 0 or acquired == 1 then
+    redis.call('ltrim', KEYS[1], 0, limit - 1)
+    redis.call('expire', KEYS[1], expiry)
+end
+
+local count = 0
+for _, entry in ipairs(redis.call('lrange', KEYS[1], 0, limit - 1)) do
+    if tonumber(entry) >= timestamp - expiry then
+        count = count + 1
+    end
+end
+return {acquired, count}
+"""
+
+
+class _KeyState:
+    __slots__ = ('limit', 'expiry', 'bucket', 'pending', 'synced_at', 'last_seen')
+
+    def __init__(self, limit, expiry):
+        self.limit = limit
+        self.expiry = expiry
+        # Empty until the first exact check tells us how much of the window is left
+        self.bucket = TokenBucket(limit / float(expiry), capacity=0)
+        self.pending = 0
+        self.synced_at = 0.0
+        self.last_seen = time.monotonic()
+
+
+class HybridRedisStorage(RedisStorage):
+    """
+    Moving-window Redis storage with an in-process token bucket in front.
+
+    Use it with ``RATELIMIT_STORAGE_URI = "hybrid+redis://host:port"``. Every
+    key gets a local bucket holding this process's part of the headroom Redis
+    reported at the last sync: ``hybrid_local_share`` of what is left above
+    the ``hybrid_margin``, divided by ``hybrid_workers``. Hits are admitted
+    from it with no I/O and recorded in Redis by a background thread every
+    ``hybrid_sync_interval`` seconds, in one pipelined round trip for the
+    keys in use. Once a bucket runs dry, or the window is within the margin
+    of its limit, requests fall back to an exact Redis check.
+
+    As long as no more than ``hybrid_workers`` processes share the limit,
+    their buckets together never hold more than the headroom below the
+    margin, so local admissions cannot push a window past its limit. A
+    bucket whose share rounds down to nothing admits every hit exactly, so
+    ``hybrid_min_limit`` only needs to keep out the very smallest limits,
+    which always go straight to Redis, as do strategies other than moving
+    window. Keys idle for two sync intervals are dropped locally; their
+    next hit is checked exactly.
+    """
+
+    STORAGE_SCHEME = ["hybrid+redis"]
+
+    def __init__(self, uri: str, hybrid_sync_interval: float = 0.5, hybrid_local_share: float = 0.5,
+                 hybrid_margin: float = 0.1, hybrid_workers: int = 1, hybrid_min_limit: int = 10, **options):
+        self.sync_interval = float(hybrid_sync_interval)
+        self.local_share = float(hybrid_local_share)
+        self.margin = float(hybrid_margin)
+        self.workers = max(1, int(hybrid_workers))
+        self.min_limit = int(hybrid_min_limit)
+        self._states = {}
+        self._lock = threading.Lock()
+        self._syncer = None
+        self._syncer_pid = None
+        super().__init__(uri.replace('hybrid+', '', 1), **options)
+
+    def initialize_storage(self, uri: str) -> None:
+        super().initialize_storage(uri)
+        self.lua_sync = self.get_connection().register_script(SYNC_SCRIPT)
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        with timed('ratelimit'):
+            if limit < self.min_limit:
+                return super().acquire_entry(key, limit, expiry, amount)
+            self._ensure_syncer()
+            state = self._state(key, limit, expiry)
+            if state.bucket.try_consume(amount):
+                with self._lock:
+                    state.pending += amount
+                return True
+            # Out of local budget, so close to the limit: ask Redis exactly
+            return self._exact_acquire(key, state, amount)
+
+    def get_moving_window(self, key: str, limit: int, expiry: int):
+        start, count = super().get_moving_window(key, limit, expiry)
+        state = self._states.get(key)
+        return start, count + (state.pending if state is not None else 0)
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._states.pop(key, None)
+        super().clear(key)
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+        return super().reset()
+
+    def _state(self, key, limit, expiry):
+        state = self._states.get(key)
+        if state is None or state.limit != limit or state.expiry != expiry:
+            with self._lock:
+                state = self._states.get(key)
+                if state is None or state.limit != limit or state.expiry != expiry:
+                    state = self._states[key] = _KeyState(limit, expiry)
+        state.last_seen = time.monotonic()
+        return state
+
+    def _take_pending(self, state):
+        with self._lock:
+            pending, state.pending = state.pending, 0
+        return pending
+
+    def _return_pending(self, state, pending):
+        with self._lock:
+            state.pending += pending
+
+    def _refill(self, state, count):
+        """Hand this process its part of the headroom Redis reported, none near the limit."""
+        headroom = state.limit - count - state.limit * self.margin
+        tokens = max(0, math.floor(headroom * self.local_share / self.workers))
+        state.bucket.reset(tokens, capacity=tokens)
+        state.synced_at = time.monotonic()
+
+    def _exact_acquire(self, key, state, amount):
+        pending = self._take_pending(state)
+        try:
+            acquired, count = self.lua_sync(
+                [self.prefixed_key(key)], [time.time(), state.limit, state.expiry, pending, amount])
+        except Exception:
+            self._return_pending(state, pending)
+            raise
+        self._refill(state, count)
+        return bool(acquired)
+
+    def sync(self) -> None:
+        """Record locally admitted hits in Redis and refresh the budget of every key in use."""
+        now = time.monotonic()
+        idle_after = 2 * self.sync_interval
+        with self._lock:
+            # Refreshing idle keys would cost a Redis call per key ever seen; drop them instead
+            for key in [k for k, s in self._states.items() if now - s.last_seen > idle_after and not s.pending]:
+                del self._states[key]
+            due = [(key, state) for key, state in self._states.items()
+                   if state.pending or now - state.synced_at >= self.sync_interval]
+        if not due:
+            return
+
+        taken = [self._take_pending(state) for _, state in due]
+        timestamp = time.time()
+        pipe = self.get_connection().pipeline(transaction=False)
+        for (key, state), pending in zip(due, taken):
+            self.lua_sync([self.prefixed_key(key)], [timestamp, state.limit, state.expiry, pending, 0], client=pipe)
+        try:
+            results = pipe.execute()
+        except Exception:
+            for (_, state), pending in zip(due, taken):
+                self._return_pending(state, pending)
+            raise
+        for (_, state), (_, count) in zip(due, results):
+            self._refill(state, count)
+
+    def _ensure_syncer(self):
+        """Start the sync thread on first use, and again after a fork."""
+        pid = os.getpid()
+        if self._syncer_pid == pid and self._syncer.is_alive():
+            return
+        with self._lock:
+            if self._syncer_pid == pid and self._syncer.is_alive():
+                return
+            if self._syncer_pid is not None and self._syncer_pid != pid:
+                # Hits counted by the parent are not ours to record
+                self._states.clear()
+            self._syncer = threading.Thread(target=self._sync_loop, name='ratelimit-sync', daemon=True)
+            self._syncer_pid = pid
+            self._syncer.start()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning("Rate limit sync failed: %s", e)
@@ -0,0 +1,268 @@
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, request
+from pymongo import monitoring
+
+from ..utils import timing
+from .extensions import limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Attributes the server-reported duration of every Mongo command to the ``mongo`` phase."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        timing.record('mongo', event.duration_micros / 1e6)
+
+    def failed(self, event):
+        timing.record('mongo', event.duration_micros / 1e6)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Instrumentation:
+    """
+    Per-request timing of the phases a request spends in Mongo, Redis, the
+    password KDF, JWT signing and verification and the rate limiter.
+
+    Every response gets a ``Server-Timing`` header with the phases it used
+    (``METRICS_SERVER_TIMING``). Phases can nest, e.g. the limiter's Redis
+    calls count towards both ``ratelimit`` and ``redis``, and ``app`` is the
+    whole request.
+
+    Latencies are also aggregated into histograms per endpoint and phase.
+    Each worker writes its aggregates to ``METRICS_DIR`` every
+    ``METRICS_FLUSH_INTERVAL`` seconds; ``/metrics`` merges every worker's
+    file into one Prometheus text exposition, so any gunicorn worker can
+    answer a scrape. An exiting worker calls ``retire`` to fold its totals
+    into one shared file of retired workers and delete its own, so counters
+    never go backwards and worker recycling does not pile up files. Clear
+    the directory when the server starts.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.server_timing = True
+        self.buckets = DEFAULT_BUCKETS
+        self.directory = None
+        self.flush_interval = 5
+        self.histograms = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+        self._mongo_listener = None
+        self._retired = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('METRICS_ENABLED', True)
+        self.server_timing = config.get('METRICS_SERVER_TIMING', True)
+        self.buckets = tuple(sorted(config.get('METRICS_BUCKETS', DEFAULT_BUCKETS)))
+        self.directory = config.get('METRICS_DIR')
+        self.flush_interval = config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        if self._mongo_listener is None:
+            # Only clients created after this see the listener, so call before connect()
+            self._mongo_listener = MongoCommandTimer()
+            monitoring.register(self._mongo_listener)
+        # Ahead of the limiter's hook, so its time is measured and throttled requests are counted
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(config.get('METRICS_PATH', '/metrics'), 'metrics', self.metrics_view)
+        # A scraper polls from one address far more often than the default per-IP limits allow
+        limiter.exempt(self.metrics_view)
+
+    def _before_request(self):
+        request.environ['app.timing'] = (timing.start_request(), time.perf_counter())
+
+    def _after_request(self, response):
+        started = request.environ.pop('app.timing', None)
+        if started is None:
+            return response
+        token, start = started
+        phases = timing.end_request(token)
+        phases['app'] = [time.perf_counter() - start, 1]
+        if request.endpoint == 'metrics':
+            return response
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = ', '.join(
+                f'{phase};dur={seconds * 1000:.2f}' for phase, (seconds, _) in phases.items())
+        self.observe(request.url_rule.rule if request.url_rule else '<unmatched>', request.method,
+                     response.status_code, phases)
+        return response
+
+    def observe(self, endpoint: str, method: str, status: int, phases: dict) -> None:
+        self._ensure_flusher()
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for phase, (seconds, _) in phases.items():
+                histogram = self.histograms.get((endpoint, phase))
+                if histogram is None:
+                    histogram = self.histograms[(endpoint, phase)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram[1] += seconds
+                histogram[2] += 1
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'histograms': [[endpoint, phase, list(counts), total, count]
+                               for (endpoint, phase), (counts, total, count) in self.histograms.items()],
+                'requests': [[*key, count] for key, count in self.requests.items()],
+            }
+
+    def flush(self) -> None:
+        """Write this worker's aggregates to its file in ``METRICS_DIR``."""
+        if not self.directory or self._retired:
+            return
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def retire(self) -> None:
+        """Fold this exiting worker's aggregates into the retired-workers file and drop its own file."""
+        if not self.directory:
+            return
+        self._retired = True
+        retired_path = os.path.join(self.directory, 'metrics_retired.json')
+        with open(os.path.join(self.directory, 'retired.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = [self._snapshot()]
+            try:
+                with open(retired_path) as f:
+                    snapshots.append(json.load(f))
+            except FileNotFoundError:
+                pass
+            except ValueError as e:
+                logger.warning("Replacing unreadable retired metrics file: %s", e)
+            histograms, requests = self._merge(snapshots)
+            tmp_path = retired_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'buckets': list(self.buckets),
+                    'histograms': [[endpoint, phase, counts, total, count]
+                                   for (endpoint, phase), (counts, total, count) in histograms.items()],
+                    'requests': [[*key, count] for key, count in requests.items()],
+                }, f)
+            os.replace(tmp_path, retired_path)
+            try:
+                os.remove(os.path.join(self.directory, f'metrics_{os.getpid()}.json'))
+            except FileNotFoundError:
+                pass
+
+    def _ensure_flusher(self):
+        """Start the flush thread on first use, and again after a fork."""
+        if not self.directory:
+            return
+        pid = os.getpid()
+        if self._flusher_pid == pid and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher_pid == pid and self._flusher.is_alive():
+                return
+            if self._flusher_pid is not None and self._flusher_pid != pid:
+                # Requests counted by the parent are in the parent's file
+                self.histograms.clear()
+                self.requests.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher_pid = pid
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Metrics flush failed: %s", e)
+
+    def _collect(self) -> list:
+        """Snapshots of every worker, with this one's flushed first."""
+        if not self.directory:
+            return [self._snapshot()]
+        self.flush()
+        snapshots = []
+        # Shared lock: a worker being retired is counted either in its own file or in the retired one, never both
+        with open(os.path.join(self.directory, 'retired.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping unreadable metrics file %s: %s", path, e)
+        return snapshots
+
+    def _merge(self, snapshots):
+        """Sum snapshots into ``{(endpoint, phase): [counts, total, count]}`` and ``{(endpoint, method, status): count}``."""
+        histograms, requests = {}, {}
+        for snapshot in snapshots:
+            if snapshot.get('buckets') != list(self.buckets):
+                continue  # Written with other bucket bounds, cannot be merged
+            for endpoint, phase, counts, total, count in snapshot['histograms']:
+                merged = histograms.setdefault((endpoint, phase), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+            for endpoint, method, status, count in snapshot['requests']:
+                key = (endpoint, method, status)
+                requests[key] = requests.get(key, 0) + count
+        return histograms, requests
+
+    def render(self) -> str:
+        """Prometheus text exposition of the aggregates of every worker."""
+        histograms, requests = self._merge(self._collect())
+        lines = [
+            '# HELP app_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE app_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'app_requests_total{{endpoint="{_escape_label(endpoint)}",method="{method}",'
+                         f'status="{status}"}} {count}')
+        lines += [
+            '# HELP app_request_phase_seconds Time a request spent in each phase, by endpoint.',
+            '# TYPE app_request_phase_seconds histogram',
+        ]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for (endpoint, phase), (counts, total, count) in sorted(histograms.items()):
+            labels = f'endpoint="{_escape_label(endpoint)}",phase="{_escape_label(phase)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'app_request_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'app_request_phase_seconds_sum{{{labels}}} {total}')
+            lines.append(f'app_request_phase_seconds_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+instrumentation = Instrumentation()
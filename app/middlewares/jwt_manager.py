@@ -0,0 +1,74 @@
+import hashlib
+import time
+from hmac import compare_digest
+
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config
+
+from ..utils.lru import TTLCache
+from ..utils.timing import timed
+
+
+class CachingJWTManager(JWTManager):
+    """
+    JWTManager that can remember the verified claims of recently seen tokens.
+
+    With ``JWT_CLAIMS_CACHE_ENABLED`` a token that already passed signature
+    and claim verification is answered from a bounded in-process cache, keyed
+    by a digest of the encoded token, until it expires (and at most
+    ``JWT_CLAIMS_CACHE_MAX_TTL`` seconds). Only decoding is cached: type,
+    freshness, blocklist and custom checks still run on every request, so a
+    revoked token is rejected as soon as the blocklist knows about it.
+    """
+
+    def __init__(self, app=None, add_context_processor: bool = False):
+        self.claims_cache = None
+        self.claims_cache_max_ttl = 300
+        self.claims_cache_hits = 0
+        self.claims_cache_misses = 0
+        super().__init__(app, add_context_processor)
+
+    def init_app(self, app, add_context_processor: bool = False) -> None:
+        super().init_app(app, add_context_processor)
+        if app.config.get('JWT_CLAIMS_CACHE_ENABLED', False):
+            self.claims_cache = TTLCache(maxsize=app.config.get('JWT_CLAIMS_CACHE_SIZE', 10000),
+                                         ttl=app.config.get('JWT_CLAIMS_CACHE_MAX_TTL', 300))
+            self.claims_cache_max_ttl = app.config.get('JWT_CLAIMS_CACHE_MAX_TTL', 300)
+        else:
+            self.claims_cache = None
+
+    def _decode_jwt_from_config(self, encoded_token: str, csrf_value=None, allow_expired: bool = False) -> dict:
+        with timed('jwt'):
+            return self._decode_cached(encoded_token, csrf_value, allow_expired)
+
+    def _decode_cached(self, encoded_token, csrf_value, allow_expired):
+        if self.claims_cache is None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.blake2b(encoded_token.encode('utf-8'), digest_size=20).digest()
+        entry = self.claims_cache.get(key)
+        if entry is not None:
+            claims, expires_at = entry
+            csrf_ok = not csrf_value or compare_digest(claims.get('csrf', ''), csrf_value)
+            if time.time() < expires_at and csrf_ok:
+                self.claims_cache_hits += 1
+                return dict(claims)
+            # Expired or a CSRF mismatch: let the full decode raise the proper error
+            self.claims_cache.delete(key)
+
+        self.claims_cache_misses += 1
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        if 'exp' in claims:
+            expires_at = claims['exp'] + config.leeway
+            ttl = min(expires_at - time.time(), self.claims_cache_max_ttl)
+            if ttl > 0:
+                self.claims_cache.set(key, (claims, expires_at), ttl=ttl)
+        return dict(claims)
+
+    def claims_cache_stats(self) -> dict:
+        return {
+            'enabled': self.claims_cache is not None,
+            'size': len(self.claims_cache) if self.claims_cache is not None else 0,
+            'hits': self.claims_cache_hits,
+            'misses': self.claims_cache_misses,
+        }
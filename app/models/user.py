@@ -1,14 +1,80 @@
 from mongoengine import Document, StringField
-from werkzeug.security import generate_password_hash, check_password_hash
+from pymongo import UpdateOne
+from ..services.hashing_service import hashing_service
+
+class DuplicateIdentifierError(Exception):
+    """Raised when users differ only by case, which the case-insensitive unique indexes cannot allow."""
+
 
 class User(Document):
     username = StringField(required=True, unique=True, max_length=80)
     email = StringField(required=True, unique=True, max_length=120)
+    # Lower-cased copies used for case-insensitive, indexed lookups
+    username_lower = StringField(max_length=80)
+    email_lower = StringField(max_length=120)
     password_hash = StringField(required=True)
     role = StringField(default='user')
 
+    meta = {
+        'indexes': [
+            {'fields': ['username_lower'], 'unique': True, 'sparse': True},
+            {'fields': ['email_lower'], 'unique': True, 'sparse': True},
+        ],
+        # Indexes are created once by User.migrate() at startup, not on first query
+        'auto_create_index': False,
+    }
+
+    def clean(self):
+        self.username_lower = self.username.lower() if self.username else None
+        self.email_lower = self.email.lower() if self.email else None
+
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hashing_service.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hashing_service.verify_password(self.password_hash, password)
+
+    @classmethod
+    def migrate(cls, batch_size=1000):
+        """Backfill the normalized lookup fields and ensure all declared indexes exist."""
+        collection = cls._get_collection()
+        missing = collection.find(
+            {'$or': [{'username_lower': {'$exists': False}}, {'email_lower': {'$exists': False}}]},
+            {'username': 1, 'email': 1},
+        )
+        updates = []
+        for doc in missing:
+            updates.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+                'username_lower': doc['username'].lower(),
+                'email_lower': doc['email'].lower(),
+            }}))
+            if len(updates) >= batch_size:
+                collection.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+        cls._check_case_duplicates(collection)
+        cls.ensure_indexes()
+
+    @classmethod
+    def _check_case_duplicates(cls, collection, limit=20):
+        """
+        Refuse to build the unique lower-case indexes over usernames or emails
+        that differ only by case. Those users need merging or renaming first;
+        carrying on would leave case-insensitive login without its index.
+        """
+        indexed = {tuple(info['key'])[0][0] for info in collection.index_information().values() if info.get('unique')}
+        problems = []
+        for field in ('username_lower', 'email_lower'):
+            if field in indexed:
+                continue
+            for group in collection.aggregate([
+                {'$match': {field: {'$type': 'string'}}},
+                {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+                {'$match': {'count': {'$gt': 1}}},
+                {'$limit': limit},
+            ], allowDiskUse=True):
+                problems.append(f"{field}={group['_id']!r} ({group['count']} users)")
+        if problems:
+            raise DuplicateIdentifierError(
+                "Users differ only by case, cannot create unique lower-case indexes: " + ', '.join(problems))
\ No newline at end of file
@@ -1,39 +1,180 @@
 from flask import Blueprint, request, jsonify
 from flask_restx import Namespace, Resource, fields
-from ..services.ratelimit_service import reset_rate_limit_for_ip
+from ..services.ratelimit_service import reset_rate_limits, inspect_rate_limits, RateLimitStorageUnavailable
+from ..services.hashing_service import hashing_service
+from ..utils.redis_pool import redis_pool
+from ..utils.startup import startup_report, readiness
+from ..services.user_service import UserService
+from ..utils.permissions import Permission, permission_registry
+from ..utils.security import permissions_required
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 admin_ns = Namespace('admin', description='Admin operations')
 
 reset_limit_model = admin_ns.model('ResetRateLimitRequest', {
-    'ip': fields.String(required=True, description='IP address to reset rate limit for', example='127.0.0.1')
+    'ip': fields.String(description='IP address to reset rate limit for', example='127.0.0.1'),
+    'ips': fields.List(fields.String, description='Several IP addresses to reset at once', example=['10.0.0.1', '10.0.0.2']),
+    'cidrs': fields.List(fields.String, description='CIDR ranges whose addresses are all reset', example=['10.0.0.0/24'])
 })
 
 reset_limit_response_model = admin_ns.model('ResetRateLimitResponse', {
-    'message': fields.String(description='Success message')
+    'message': fields.String(description='Success message'),
+    'deleted': fields.Integer(description='Rate limit keys deleted')
+})
+
+rate_limit_usage_model = admin_ns.model('RateLimitUsage', {
+    'key': fields.String(description='Storage key'),
+    'ip': fields.String(description='Client the limit applies to'),
+    'scope': fields.String(description='Endpoint or shared scope of the limit'),
+    'limit': fields.String(description='Limit, e.g. "10 per 1 minute"'),
+    'strategy': fields.String(description='fixed-window, moving-window or sliding-window'),
+    'previous_window': fields.Boolean(description='Sliding-window counter for the previous window'),
+    'used': fields.Integer(description='Hits counted in the current window'),
+    'remaining': fields.Integer(description='Hits left in the current window'),
+    'ttl': fields.Float(description='Seconds until the key expires')
 })
 
 @admin_ns.route('/reset-rate-limit')
 class ResetRateLimit(Resource):
+    @permissions_required(all_of=[Permission.MANAGE_RATE_LIMITS])
     @admin_ns.expect(reset_limit_model)
     @admin_ns.marshal_with(reset_limit_response_model)
     @admin_ns.doc(responses={
         200: 'Reset successful',
-        400: 'IP address missing or invalid'
+        400: 'IP address missing or invalid',
+        401: 'Unauthorized',
+        403: 'Forbidden',
+        503: 'Rate limit storage unavailable'
     })
     def post(self):
         data = request.json or {}
-        ip = data.get('ip')
-        if not ip:
+        ips = list(data.get('ips') or [])
+        if data.get('ip'):
+            ips.append(data['ip'])
+        cidrs = list(data.get('cidrs') or [])
+        if not ips and not cidrs:
             admin_ns.abort(400, 'IP address is required')
 
-        deleted_keys = reset_rate_limit_for_ip(ip)
+        try:
+            deleted_keys = reset_rate_limits(ips=ips, networks=cidrs)
+        except ValueError as e:
+            admin_ns.abort(400, str(e))
+        except RateLimitStorageUnavailable as e:
+            admin_ns.abort(503, str(e))
+        targets = f'IP {ips[0]}' if ips and len(ips) + len(cidrs) == 1 else ', '.join(ips + cidrs)
         return {
-            'message': f'Reset {deleted_keys} rate limit keys for IP {ip}'
+            'message': f'Reset {deleted_keys} rate limit keys for {targets}',
+            'deleted': deleted_keys
         }, 200
 
 
+@admin_ns.route('/rate-limits')
+class RateLimits(Resource):
+    @permissions_required(all_of=[Permission.MANAGE_RATE_LIMITS])
+    @admin_ns.marshal_list_with(rate_limit_usage_model)
+    @admin_ns.doc(params={'ip': 'Only keys of this IP', 'cidr': 'Only keys of IPs in this range',
+                          'limit': 'Maximum keys returned (default 100, max 1000)'},
+                  responses={200: 'Current window usage per key', 400: 'Invalid IP or range',
+                             401: 'Unauthorized', 403: 'Forbidden', 503: 'Rate limit storage unavailable'})
+    def get(self):
+        try:
+            max_keys = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            return inspect_rate_limits(ip=request.args.get('ip'), network=request.args.get('cidr'),
+                                       max_keys=max_keys), 200
+        except ValueError as e:
+            admin_ns.abort(400, str(e))
+        except RateLimitStorageUnavailable as e:
+            admin_ns.abort(503, str(e))
+
+
+hashing_stats_model = admin_ns.model('HashingStatsResponse', {
+    'workers': fields.Integer(description='Hashing worker processes'),
+    'queue_size': fields.Integer(description='Queued hashes allowed beyond busy workers'),
+    'in_flight': fields.Integer(description='Hashes admitted and not yet finished'),
+    'queue_depth': fields.Integer(description='Hashes waiting for a free worker'),
+    'rejected': fields.Integer(description='Hashes rejected with 503 since startup'),
+    'completed': fields.Integer(description='Hashes finished since startup'),
+    'latency_avg_ms': fields.Float(description='Average end-to-end hashing latency'),
+    'latency_last_ms': fields.Float(description='Latency of the most recent hash'),
+    'latency_max_ms': fields.Float(description='Worst hashing latency since startup')
+})
+
+@admin_ns.route('/hashing-stats')
+class HashingStats(Resource):
+    @permissions_required(all_of=[Permission.VIEW_STATS])
+    @admin_ns.marshal_with(hashing_stats_model)
+    @admin_ns.doc(responses={200: 'Current password hashing gauges', 401: 'Unauthorized', 403: 'Forbidden'})
+    def get(self):
+        return hashing_service.stats(), 200
+
+redis_pool_stats_model = admin_ns.model('RedisPoolStatsResponse', {
+    'max_connections': fields.Integer(description='Connections this worker may open'),
+    'created': fields.Integer(description='Connections opened so far'),
+    'in_use': fields.Integer(description='Connections checked out right now'),
+    'idle': fields.Integer(description='Open connections waiting in the pool'),
+    'checkouts': fields.Integer(description='Connections handed out since startup'),
+    'waits': fields.Integer(description='Checkouts that found the pool exhausted'),
+    'timeouts': fields.Integer(description='Waits that gave up without a connection'),
+    'wait_time_total_ms': fields.Float(description='Time spent waiting for a connection'),
+    'wait_time_avg_ms': fields.Float(description='Average wait of a checkout that had to wait'),
+    'wait_time_max_ms': fields.Float(description='Longest wait for a connection')
+})
+
+@admin_ns.route('/redis-pool-stats')
+class RedisPoolStats(Resource):
+    @permissions_required(all_of=[Permission.VIEW_STATS])
+    @admin_ns.marshal_with(redis_pool_stats_model)
+    @admin_ns.doc(responses={200: 'Redis connection pool utilisation for this worker', 401: 'Unauthorized',
+                             403: 'Forbidden'})
+    def get(self):
+        return redis_pool.stats(), 200
+
+@admin_ns.route('/startup-report')
+class StartupReport(Resource):
+    @permissions_required(all_of=[Permission.VIEW_STATS])
+    @admin_ns.doc(responses={200: 'Boot time by step, slowest imports and background startup tasks of this worker',
+                             401: 'Unauthorized', 403: 'Forbidden'})
+    def get(self):
+        return dict(startup_report.as_dict(), ready=readiness.ready, tasks=readiness.status), 200
+
+update_role_model = admin_ns.model('UpdateRoleRequest', {
+    'identifier': fields.String(required=True, description='Username or email of the user', example='user1'),
+    'role': fields.String(required=True, description='New role', example='admin')
+})
+
+update_role_response_model = admin_ns.model('UpdateRoleResponse', {
+    'username': fields.String(description='Username'),
+    'role': fields.String(description='Role after the update')
+})
+
+@admin_ns.route('/user-role')
+class UpdateUserRole(Resource):
+    @permissions_required(all_of=[Permission.MANAGE_USERS])
+    @admin_ns.expect(update_role_model)
+    @admin_ns.marshal_with(update_role_response_model)
+    @admin_ns.doc(responses={
+        200: 'Role updated',
+        400: 'Identifier or role missing, or unknown role',
+        401: 'Unauthorized',
+        403: 'Forbidden',
+        404: 'User not found'
+    })
+    def post(self):
+        data = request.json or {}
+        identifier = data.get('identifier')
+        role = data.get('role')
+        if not identifier or not role:
+            admin_ns.abort(400, 'Identifier and role are required')
+        if not permission_registry.is_role(role):
+            admin_ns.abort(400, f"Unknown role '{role}'")
+
+        try:
+            user = UserService.update_role(identifier, role)
+        except ValueError as e:
+            admin_ns.abort(404, str(e))
+        return {'username': user.username, 'role': user.role}, 200
+
 
 # Register Namespace routes to the blueprint
 def register_admin_namespace(api):
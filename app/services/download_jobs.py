@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+from . import download_service
+from .media_cache import media_cache
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ('video', 'playlist', 'channel')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+DONE_STATES = (FINISHED, FAILED, CANCELLED)
+
+# KEYS: job hash, owner's active-job zset scored by heartbeat.
+# ARGV: job id, per-owner limit, ttl, now, heartbeat age after which a job is abandoned, then field/value pairs.
+SUBMIT_SCRIPT = """
+-- Jobs of workers that died without cleaning up stop counting once their heartbeat is stale
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[4]) - tonumber(ARGV[5]))
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('HSET', KEYS[1], unpack(ARGV, 6))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+_UNSAFE_FILENAME = re.compile(r'[\x00-\x1f\x7f/\\:*?"<>|]+')
+
+
+def safe_filename(name: str, default: str) -> str:
+    """A title usable as a download name: no path separators, control or reserved characters."""
+    name = _UNSAFE_FILENAME.sub('_', name or '').strip(' ._')
+    return name[:200] or default
+
+
+class JobLimitError(Exception):
+    """Raised when an owner already has the maximum number of active jobs."""
+
+
+class DownloadJobManager:
+    """
+    Runs yt-dlp downloads on a local worker pool, off the request workers.
+
+    Job state lives in a Redis hash per job so any worker can report status,
+    serve results or cancel; the download itself runs in the process that
+    accepted it. Each owner may have ``DOWNLOAD_JOB_USER_LIMIT`` jobs queued or
+    running at once.
+
+    The process holding a job refreshes its heartbeat every
+    ``DOWNLOAD_JOB_HEARTBEAT`` seconds. If the process dies mid-job (killed,
+    out of memory, recycled by gunicorn) the heartbeat goes stale after
+    ``DOWNLOAD_JOB_STALE_AFTER`` seconds: the job is then reported as failed
+    and no longer counts towards its owner's limit.
+    """
+
+    def __init__(self, app=None):
+        self.max_workers = 2
+        self.user_limit = 2
+        self.ttl = 86400
+        self.heartbeat_interval = 15
+        self.stale_after = 60
+        self.key_prefix = 'download_job:'
+        self.folder = None
+        self.parallel = True
+        self.parallel_settings = {}
+        self._redis = None
+        self._executor = None
+        self._pid = None
+        self._submit_script = None
+        self._held = {}
+        self._heartbeat = None
+        self._heartbeat_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('DOWNLOAD_JOB_WORKERS', self.max_workers)
+        self.user_limit = app.config.get('DOWNLOAD_JOB_USER_LIMIT', self.user_limit)
+        self.ttl = app.config.get('DOWNLOAD_JOB_TTL', self.ttl)
+        self.heartbeat_interval = app.config.get('DOWNLOAD_JOB_HEARTBEAT', self.heartbeat_interval)
+        self.stale_after = app.config.get('DOWNLOAD_JOB_STALE_AFTER', self.stale_after)
+        self.key_prefix = app.config.get('CACHE_KEY_PREFIX', '') + 'download_job:'
+        self.folder = os.path.join(app.config['DOWNLOAD_FOLDER'], 'jobs')
+        self.parallel = app.config.get('DOWNLOAD_PARALLEL_ENTRIES', self.parallel)
+        self.parallel_settings = download_service.parallel_settings(app.config)
+        self._redis = get_redis(app)
+        self._submit_script = self._redis.register_script(SUBMIT_SCRIPT) if self._redis is not None else None
+        app.extensions['download_jobs'] = self
+
+    @property
+    def available(self) -> bool:
+        return self._redis is not None
+
+    def _job_key(self, job_id):
+        return f"{self.key_prefix}{job_id}"
+
+    def _active_key(self, owner):
+        return f"{self.key_prefix}active:{owner}"
+
+    def _get_executor(self):
+        """Create the worker pool lazily, and again after a fork."""
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='download-job')
+                    self._pid = pid
+        return self._executor
+
+    def submit(self, owner: str, kind: str, url: str) -> str:
+        """Queue a download and return its job id."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        fields = {
+            'id': job_id, 'owner': owner, 'kind': kind, 'url': url, 'status': QUEUED,
+            'progress': 0, 'downloaded_bytes': 0, 'total_bytes': 0,
+            'entries_done': 0, 'entries_total': 0, 'cancel': 0,
+            'created_at': now, 'updated_at': now, 'heartbeat_at': now,
+        }
+        args = [job_id, self.user_limit, self.ttl, now, self.stale_after]
+        for name, value in fields.items():
+            args.extend([name, value])
+        if not self._submit_script(keys=[self._job_key(job_id), self._active_key(owner)], args=args):
+            raise JobLimitError(f"At most {self.user_limit} active download jobs allowed")
+        self._ensure_heartbeat()
+        # Job archives are swept by the media cache janitor, which a job may otherwise never start
+        media_cache.ensure_janitor()
+        with self._lock:
+            self._held[job_id] = owner
+        self._get_executor().submit(self._run, job_id, owner, kind, url)
+        logger.info("Queued %s download job %s for %s", kind, job_id, owner)
+        return job_id
+
+    def get(self, job_id: str):
+        """Return the job's state as a dict, or None if it is unknown or expired."""
+        raw = self._redis.hgetall(self._job_key(job_id))
+        if not raw:
+            return None
+        job = {k.decode(): v.decode() for k, v in raw.items()}
+        for name in ('downloaded_bytes', 'total_bytes', 'entries_done', 'entries_total', 'entries_failed', 'cancel'):
+            job[name] = int(float(job.get(name) or 0))
+        job['failures'] = json.loads(job['failures']) if job.get('failures') else []
+        for name in ('progress', 'created_at', 'updated_at', 'heartbeat_at'):
+            job[name] = float(job.get(name) or 0)
+        if job['status'] not in DONE_STATES and time.time() - job['heartbeat_at'] > self.stale_after:
+            job['status'] = FAILED
+            job['error'] = 'The worker running this job stopped'
+        return job
+
+    def cancel(self, job_id: str) -> None:
+        """Ask a job to stop. Queued jobs never start; running ones stop at the next progress tick."""
+        key = self._job_key(job_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(key, mapping={'cancel': 1, 'updated_at': time.time()})
+        pipe.hget(key, 'status')
+        _, status = pipe.execute()
+        if status == QUEUED.encode():
+            self._update(job_id, status=CANCELLED)
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        self._redis.hset(self._job_key(job_id), mapping=fields)
+
+    def _ensure_heartbeat(self):
+        """Start the heartbeat thread on first use, and again after a fork."""
+        pid = os.getpid()
+        if self._heartbeat_pid == pid and self._heartbeat.is_alive():
+            return
+        with self._lock:
+            if self._heartbeat_pid == pid and self._heartbeat.is_alive():
+                return
+            if self._heartbeat_pid is not None and self._heartbeat_pid != pid:
+                # Jobs held by the parent do not run here
+                self._held.clear()
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='download-job-heartbeat', daemon=True)
+            self._heartbeat_pid = pid
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.beat()
+            except Exception as e:
+                logger.warning("Download job heartbeat failed: %s", e)
+
+    def beat(self) -> None:
+        """Refresh the heartbeat of every job queued or running in this process."""
+        with self._lock:
+            held = list(self._held.items())
+        if not held:
+            return
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        for job_id, owner in held:
+            pipe.zadd(self._active_key(owner), {job_id: now}, xx=True)
+            pipe.hset(self._job_key(job_id), 'heartbeat_at', now)
+        pipe.execute()
+
+    def _cancel_requested(self, job_id) -> bool:
+        return self._redis.hget(self._job_key(job_id), 'cancel') == b'1'
+
+    def _progress_hook(self, job_id):
+        from yt_dlp.utils import DownloadCancelled
+
+        state = {'written': 0.0, 'checked': 0.0}
+
+        def hook(d):
+            now = time.monotonic()
+            if now - state['checked'] >= 1.0:
+                state['checked'] = now
+                if self._cancel_requested(job_id):
+                    raise DownloadCancelled()
+            if d.get('status') != 'downloading' and d.get('status') != 'finished':
+                return
+            if d.get('status') == 'downloading' and now - state['written'] < 0.5:
+                return
+            state['written'] = now
+            info = d.get('info_dict') or {}
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            fields = {'downloaded_bytes': downloaded, 'total_bytes': int(total)}
+            entries_total = info.get('n_entries') or info.get('playlist_count')
+            if entries_total:
+                index = info.get('playlist_index') or 1
+                done = index if d.get('status') == 'finished' else index - 1
+                fields.update(entries_done=done, entries_total=entries_total,
+                              progress=round(100.0 * done / entries_total, 1))
+            elif total:
+                fields['progress'] = round(100.0 * downloaded / total, 1)
+            self._update(job_id, **fields)
+
+        return hook
+
+    def _download_entries(self, job_id, url, job_dir, empty_message):
+        """Download playlist entries in parallel, recording progress and failures as each one ends.
+
+        Returns ``(title, results)`` with the successful ``EntryResult``s in playlist order.
+        """
+        from yt_dlp.utils import DownloadCancelled
+
+        info = download_service.extract_collection(url)
+        entries = info.get('entries') or []
+        if not entries:
+            raise ValueError(empty_message)
+        self._update(job_id, entries_total=len(entries))
+        cancel_hook = self._progress_hook(job_id)
+
+        def check_cancel(d):
+            # Progress is tracked per entry below; the hook only watches the cancel flag here
+            cancel_hook({'status': 'checking'})
+
+        succeeded, failures = [], []
+        results = download_service.iter_parallel_downloads(
+            entries, job_dir, progress_hooks=[check_cancel], **self.parallel_settings)
+        try:
+            for result in results:
+                if result.error == 'cancelled' and self._cancel_requested(job_id):
+                    raise DownloadCancelled()
+                if result.error:
+                    failures.append({'index': result.index, 'title': result.title, 'url': result.url, 'error': result.error})
+                else:
+                    succeeded.append(result)
+                done = len(succeeded) + len(failures)
+                self._update(job_id, entries_done=len(succeeded), entries_failed=len(failures),
+                             failures=json.dumps(failures), progress=round(100.0 * done / len(entries), 1))
+        finally:
+            results.close()
+        if not succeeded and failures:
+            raise ValueError(f"No playlist entries could be downloaded: {failures[0]['error']}")
+        return info.get('title'), sorted(succeeded, key=lambda result: result.index)
+
+    def _run(self, job_id, owner, kind, url):
+        # Imported here, like everything yt_dlp, so it is loaded only once downloads are used
+        from yt_dlp.utils import DownloadCancelled
+
+        job_dir = os.path.join(self.folder, job_id)
+        try:
+            if self._cancel_requested(job_id):
+                self._update(job_id, status=CANCELLED)
+                return
+            self._update(job_id, status=RUNNING)
+            hooks = [self._progress_hook(job_id)]
+            if kind == 'video':
+                # Shared with the synchronous endpoint through the media cache
+                result_path = media_cache.get_or_download(url, progress_hooks=hooks)
+                if not result_path or not os.path.exists(result_path):
+                    raise ValueError("Nothing was downloaded")
+                filename = os.path.basename(result_path)
+            else:
+                os.makedirs(job_dir, exist_ok=True)
+                empty_message = f"URL does not contain {'a playlist' if kind == 'playlist' else 'channel videos'}"
+                arcnames = None
+                if self.parallel:
+                    title, results = self._download_entries(job_id, url, job_dir, empty_message)
+                    file_paths = [result.path for result in results]
+                    arcnames = [download_service.entry_arcname(result) for result in results]
+                else:
+                    title, file_paths = download_service.download_collection(url, job_dir, progress_hooks=hooks)
+                if not file_paths:
+                    raise ValueError(empty_message)
+                # The title only names the download; the path never depends on it
+                result_path = os.path.join(job_dir, f"{job_id}.zip")
+                download_service.create_zip_from_files(result_path, file_paths, arcnames)
+                for file_path in file_paths:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                filename = f"{safe_filename(title, kind)}.zip"
+            self._update(job_id, status=FINISHED, progress=100, result_path=result_path, filename=filename)
+            logger.info("Download job %s finished", job_id)
+        except DownloadCancelled:
+            self._update(job_id, status=CANCELLED)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            logger.info("Download job %s cancelled", job_id)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e))
+            shutil.rmtree(job_dir, ignore_errors=True)
+            logger.warning("Download job %s failed: %s", job_id, e)
+        finally:
+            with self._lock:
+                self._held.pop(job_id, None)
+            self._redis.zrem(self._active_key(owner), job_id)
+
+
+download_jobs = DownloadJobManager()
@@ -0,0 +1,237 @@
+import logging
+import os
+import queue
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ..utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+EntryResult = namedtuple('EntryResult', ['index', 'title', 'url', 'path', 'error'])
+
+# Process-wide download bandwidth cap shared by every download, set by init_app().
+_global_bandwidth = None
+
+
+def init_app(app):
+    global _global_bandwidth
+    limit = app.config.get('DOWNLOAD_GLOBAL_BANDWIDTH') or 0
+    _global_bandwidth = TokenBucket(limit) if limit > 0 else None
+
+
+def parallel_settings(config):
+    """Keyword arguments for iter_parallel_downloads() taken from the app config."""
+    workers = max(1, config.get('DOWNLOAD_PLAYLIST_CONCURRENCY', 4))
+    job_bandwidth = config.get('DOWNLOAD_JOB_BANDWIDTH') or 0
+    return {
+        'workers': workers,
+        'retries': config.get('DOWNLOAD_ENTRY_RETRIES', 2),
+        # The per-job cap is split evenly across the job's concurrent entries
+        'entry_bandwidth': job_bandwidth // workers if job_bandwidth else None,
+    }
+
+
+def build_ydl_opts(output_dir, playlist=False, **extra):
+    """yt-dlp options shared by every download path."""
+    opts = {
+        'format': 'best',
+        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'ignoreerrors': True,
+        'noplaylist': not playlist,
+    }
+    opts.update(extra)
+    return opts
+
+
+def create_zip_from_files(zip_path, file_paths, arcnames=None):
+    # Media is already compressed, so entries are stored rather than deflated
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zipf:
+        for i, file_path in enumerate(file_paths):
+            if os.path.exists(file_path):
+                zipf.write(file_path, arcname=arcnames[i] if arcnames else os.path.basename(file_path))
+
+
+def _youtube_dl(opts):
+    """A ``YoutubeDL`` for ``opts``; yt_dlp, the heaviest import in the app, is loaded on first use."""
+    import yt_dlp
+    return yt_dlp.YoutubeDL(opts)
+
+
+def extract_info(url, playlist=False):
+    """
+    Metadata without downloading anything. Playlists and channels are
+    extracted flat, so their entries are stubs rather than full video info.
+    """
+    extra = {'extract_flat': 'in_playlist'} if playlist else {}
+    opts = build_ydl_opts('.', playlist=playlist, skip_download=True, **extra)
+    with _youtube_dl(opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def download_video(url, output_dir, progress_hooks=None, fmt='best', **extra):
+    """Download a single video and return its path, or None if nothing was downloaded."""
+    opts = build_ydl_opts(output_dir, progress_hooks=_with_throttle(progress_hooks), format=fmt, **extra)
+    with _youtube_dl(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        if not info:
+            return None
+        return ydl.prepare_filename(info)
+
+
+def download_collection(url, output_dir, progress_hooks=None):
+    """
+    Download every entry of a playlist or channel.
+
+    Returns ``(title, file_paths)``; ``file_paths`` is empty when the URL has no entries.
+    """
+    opts = build_ydl_opts(output_dir, playlist=True, progress_hooks=_with_throttle(progress_hooks))
+    with _youtube_dl(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        entries = (info or {}).get('entries') or []
+        file_paths = [ydl.prepare_filename(entry) for entry in entries if entry is not None]
+        return (info or {}).get('title'), file_paths
+
+
+def _with_throttle(progress_hooks):
+    """Append a hook charging downloaded bytes to the global bandwidth bucket, if one is set."""
+    hooks = list(progress_hooks or [])
+    if _global_bandwidth is None:
+        return hooks
+    seen = {}
+
+    def throttle(d):
+        if d.get('status') != 'downloading':
+            return
+        name = d.get('tmpfilename') or d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        delta = downloaded - seen.get(name, 0)
+        seen[name] = downloaded
+        if delta > 0:
+            _global_bandwidth.consume(delta)
+
+    hooks.append(throttle)
+    return hooks
+
+
+def entry_url(entry):
+    return entry.get('webpage_url') or entry.get('url')
+
+
+def entry_arcname(result):
+    """Archive name for a parallel download; the playlist index keeps names unique and in order."""
+    return f"{result.index:03d} - {os.path.basename(result.path)}"
+
+
+def extract_collection(url):
+    """Flat metadata for a playlist or channel: title and entry stubs, no media downloaded."""
+    info = extract_info(url, playlist=True) or {}
+    info['entries'] = [entry for entry in (info.get('entries') or []) if entry]
+    return info
+
+
+def iter_collection_downloads(info, output_dir, progress_hooks=None):
+    """
+    Download a playlist or channel on a background thread, yielding each file
+    path as soon as yt-dlp has finished (and post-processed) that entry.
+
+    ``info`` is the metadata from ``extract_collection``; yt-dlp resumes from
+    it, as with ``--load-info-json``, instead of extracting the page again.
+    Closing the generator early cancels the remaining downloads.
+    """
+    from yt_dlp.utils import DownloadCancelled
+
+    finished = queue.Queue()
+    cancelled = threading.Event()
+
+    def cancel_hook(d):
+        if cancelled.is_set():
+            raise DownloadCancelled()
+
+    opts = build_ydl_opts(
+        output_dir,
+        playlist=True,
+        progress_hooks=_with_throttle([cancel_hook] + list(progress_hooks or [])),
+        post_hooks=[finished.put],
+    )
+
+    def run():
+        try:
+            with _youtube_dl(opts) as ydl:
+                ydl.process_ie_result(dict(info), download=True)
+        except DownloadCancelled:
+            pass
+        except Exception as e:
+            logger.warning("Streaming download of %s stopped early: %s", info.get('webpage_url'), e)
+        finally:
+            finished.put(_DONE)
+
+    worker = threading.Thread(target=run, name='collection-download', daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = finished.get()
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        cancelled.set()
+        # Let yt-dlp notice the cancellation before the caller removes output_dir
+        worker.join(timeout=5)
+
+
+def iter_parallel_downloads(entries, output_dir, workers=4, retries=2, entry_bandwidth=None, progress_hooks=None):
+    """
+    Download flat-extracted playlist entries concurrently, yielding an
+    ``EntryResult`` for each entry as soon as it succeeds or exhausts its retries.
+
+    Each entry gets its own sub-directory so equal titles cannot collide.
+    Closing the generator early cancels the remaining downloads.
+    """
+    from yt_dlp.utils import DownloadCancelled
+
+    cancelled = threading.Event()
+
+    def cancel_hook(d):
+        if cancelled.is_set():
+            raise DownloadCancelled()
+
+    hooks = [cancel_hook] + list(progress_hooks or [])
+    extra = {'ratelimit': entry_bandwidth} if entry_bandwidth else {}
+
+    def fetch(index, entry):
+        url = entry_url(entry)
+        entry_dir = os.path.join(output_dir, f"{index:05d}")
+        error = "Nothing was downloaded"
+        for attempt in range(retries + 1):
+            if cancelled.is_set():
+                return EntryResult(index, entry.get('title'), url, None, 'cancelled')
+            try:
+                path = download_video(url, entry_dir, progress_hooks=hooks, **extra)
+                if path and os.path.exists(path):
+                    return EntryResult(index, entry.get('title'), url, path, None)
+                error = "Nothing was downloaded"
+            except DownloadCancelled:
+                return EntryResult(index, entry.get('title'), url, None, 'cancelled')
+            except Exception as e:
+                error = str(e)
+            if attempt < retries:
+                time.sleep(min(2 ** attempt, 10))
+        logger.warning("Giving up on playlist entry %s (%s): %s", index, url, error)
+        return EntryResult(index, entry.get('title'), url, None, error)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='playlist-entry')
+    try:
+        futures = [executor.submit(fetch, index, entry) for index, entry in enumerate(entries, 1)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,182 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from ..utils.hashers import get_hasher, identify_hasher, hash_with, verify_any, calibrate
+from ..utils.timing import timed
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusyError(ServiceUnavailable):
+    """Raised when the password hashing queue is full."""
+    description = "Password hashing capacity exhausted, please retry shortly"
+
+
+def default_mp_context() -> str:
+    """
+    Start method for the pool. Not ``fork``: the workers would be forked from a
+    process already running logging, sync and pub/sub threads, and could
+    inherit a lock one of them held.
+    """
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class HashingService:
+    """
+    Runs password KDF work on a dedicated process pool.
+
+    Admission is bounded by ``PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE``
+    slots; once they are all taken new requests are rejected with a 503 and a
+    ``Retry-After`` header instead of piling up on the request workers. A
+    request that times out stops waiting, but its slot is only freed once the
+    KDF finishes, so admission bounds the work really queued on the pool.
+
+    New hashes use ``PASSWORD_HASH_SCHEME``. When ``PASSWORD_HASH_BUDGET_MS`` is
+    set the cost parameters are calibrated against this machine at startup;
+    otherwise ``PASSWORD_HASH_PARAMS`` or the scheme defaults are used.
+    """
+
+    def __init__(self, app=None):
+        self.max_workers = 2
+        self.queue_size = 16
+        self.retry_after = 1
+        self.timeout = 10
+        self.mp_context = None
+        self.scheme = 'scrypt'
+        self.params = dict(get_hasher(self.scheme).default_params)
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._latency_total = 0.0
+        self._latency_last = 0.0
+        self._latency_max = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('PASSWORD_HASH_WORKERS', self.max_workers)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE_SIZE', self.queue_size)
+        self.retry_after = app.config.get('PASSWORD_HASH_RETRY_AFTER', self.retry_after)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.mp_context = app.config.get('PASSWORD_HASH_MP_CONTEXT', self.mp_context)
+        self.scheme = app.config.get('PASSWORD_HASH_SCHEME', self.scheme)
+        hasher = get_hasher(self.scheme)
+        budget_ms = app.config.get('PASSWORD_HASH_BUDGET_MS')
+        if budget_ms:
+            self.params = calibrate(self.scheme, budget_ms)
+            logger.info("Calibrated %s to %s for a %sms budget", self.scheme, self.params, budget_ms)
+        else:
+            self.params = dict(hasher.default_params, **(app.config.get('PASSWORD_HASH_PARAMS') or {}))
+        self.shutdown()
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.queue_size)
+        app.extensions['hashing_service'] = self
+
+    def _get_executor(self):
+        """Create the process pool lazily, and again after a fork."""
+        if self.max_workers <= 0:
+            return None
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    context = multiprocessing.get_context(self.mp_context or default_mp_context())
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                    self._pid = pid
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._pid = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            logger.warning("Password hashing queue full, rejecting request")
+            raise HashingBusyError(retry_after=self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args) if executor is not None else None
+        except Exception:
+            self._finish(start)
+            raise
+        if future is None:
+            try:
+                return fn(*args)
+            finally:
+                self._finish(start)
+
+        # The slot stays taken until the KDF really ends, even if this request stops waiting for it
+        future.add_done_callback(lambda _: self._finish(start))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.error("Password hashing timed out after %ss", self.timeout)
+            raise HashingBusyError(retry_after=self.retry_after)
+
+    def _finish(self, start):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            self._latency_total += elapsed
+            self._latency_last = elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+        self._slots.release()
+
+    def hash_password(self, password: str) -> str:
+        """Hash a password on the pool."""
+        with timed('kdf'):
+            return self._run(hash_with, self.scheme, self.params, password)
+
+    def verify_password(self, password_hash: str, password: str) -> bool:
+        """Check a password against a stored hash on the pool."""
+        with timed('kdf'):
+            return self._run(verify_any, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True when a stored hash uses another scheme or other cost parameters."""
+        hasher = identify_hasher(password_hash)
+        if hasher is None or hasher.name != self.scheme:
+            return True
+        try:
+            return hasher.params_of(password_hash) != self.params
+        except (ValueError, IndexError):
+            return True
+
+    def stats(self) -> dict:
+        """Snapshot of queue-depth and latency gauges."""
+        with self._lock:
+            in_flight = self._in_flight
+            completed = self._completed
+            return {
+                'scheme': self.scheme,
+                'workers': self.max_workers,
+                'queue_size': self.queue_size,
+                'in_flight': in_flight,
+                'queue_depth': max(0, in_flight - max(self.max_workers, 1)),
+                'rejected': self._rejected,
+                'completed': completed,
+                'latency_avg_ms': round(self._latency_total / completed, 3) if completed else 0.0,
+                'latency_last_ms': round(self._latency_last, 3),
+                'latency_max_ms': round(self._latency_max, 3),
+            }
+
+
+hashing_service = HashingService()
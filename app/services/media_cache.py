@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from . import download_service
+from .video_info import video_info
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS: fill lock. ARGV: the owner's token. Deletes the lock only if this owner still holds it.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class MediaCache:
+    """
+    Content-addressed cache of downloaded media, keyed by extractor, video id and format.
+
+    Every entry is a directory named after the key holding the single finished
+    file; it is assembled under a temporary name and renamed into place, so a
+    present entry is always complete. Concurrent requests for the same key
+    collapse into one download: within a process through a per-key lock and
+    across processes through a Redis lock, with waiters polling for the entry.
+    The lock holds a random token and is released only by its owner, so a
+    download outliving ``DOWNLOAD_CACHE_LOCK_TTL`` cannot free a lock another
+    process has since taken. A janitor thread evicts least recently used
+    entries once the cache exceeds ``DOWNLOAD_CACHE_MAX_BYTES`` and removes
+    expired job directories. Entries used in the last
+    ``DOWNLOAD_CACHE_PIN_SECONDS`` are never evicted, so a path handed out by
+    ``lookup`` stays servable.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.jobs_folder = None
+        self.max_bytes = 5 * 1024 ** 3
+        self.janitor_interval = 300
+        self.lock_ttl = 900
+        self.pin_seconds = 60
+        self.job_ttl = 86400
+        self.lock_prefix = 'media_lock:'
+        self._redis = None
+        self._release_script = None
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._janitor = None
+        self._janitor_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = os.path.join(app.config['DOWNLOAD_FOLDER'], 'cache')
+        self.jobs_folder = os.path.join(app.config['DOWNLOAD_FOLDER'], 'jobs')
+        self.max_bytes = app.config.get('DOWNLOAD_CACHE_MAX_BYTES', self.max_bytes)
+        self.janitor_interval = app.config.get('DOWNLOAD_CACHE_JANITOR_INTERVAL', self.janitor_interval)
+        self.lock_ttl = app.config.get('DOWNLOAD_CACHE_LOCK_TTL', self.lock_ttl)
+        self.pin_seconds = app.config.get('DOWNLOAD_CACHE_PIN_SECONDS', self.pin_seconds)
+        self.job_ttl = app.config.get('DOWNLOAD_JOB_TTL', self.job_ttl)
+        self.lock_prefix = app.config.get('CACHE_KEY_PREFIX', '') + 'media_lock:'
+        self._redis = get_redis(app)
+        self._release_script = self._redis.register_script(RELEASE_SCRIPT) if self._redis is not None else None
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions['media_cache'] = self
+
+    @staticmethod
+    def key_for(info: dict, fmt: str) -> str:
+        source = f"{info.get('extractor_key') or info.get('extractor')}:{info['id']}:{fmt}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str):
+        """Path of the cached file for a key, or None. A hit refreshes the entry's LRU position."""
+        entry_dir = os.path.join(self.folder, key)
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            return None
+        if not names:
+            return None
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return os.path.join(entry_dir, names[0])
+
+    def get_or_download(self, url: str, fmt: str = 'best', progress_hooks=None):
+        """Return the path of the media for ``url``, downloading it at most once across the fleet."""
+        self.ensure_janitor()
+        # The URL -> video id mapping is stable, so the metadata cache can answer it
+        info = video_info.get(url, playlist=False)
+        if not info or not info.get('id'):
+            return None
+        key = self.key_for(info, fmt)
+        path = self.lookup(key)
+        if path:
+            return path
+
+        with self._local_lock(key):
+            deadline = time.monotonic() + self.lock_ttl
+            while True:
+                path = self.lookup(key)
+                if path:
+                    return path
+                token = self._acquire(key)
+                if token:
+                    try:
+                        return self._download(key, url, fmt, progress_hooks)
+                    finally:
+                        self._release(key, token)
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for a concurrent download of the same media")
+                time.sleep(0.5)
+
+    def _download(self, key, url, fmt, progress_hooks=None):
+        partial_dir = os.path.join(self.folder, f".partial-{key}-{uuid.uuid4().hex}")
+        os.makedirs(partial_dir)
+        try:
+            path = download_service.download_video(url, partial_dir, progress_hooks=progress_hooks, fmt=fmt)
+            if not path or not os.path.exists(path):
+                return None
+            entry_dir = os.path.join(self.folder, key)
+            try:
+                os.rename(partial_dir, entry_dir)
+            except OSError:
+                # Another process finished first; keep its copy.
+                return self.lookup(key)
+            return os.path.join(entry_dir, os.path.basename(path))
+        finally:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+
+    def _local_lock(self, key):
+        return _KeyLock(self, key)
+
+    def _acquire(self, key):
+        """The owner token of the fill lock for ``key``, or None if another process holds it."""
+        token = uuid.uuid4().hex
+        if self._redis is None:
+            return token
+        try:
+            if self._redis.set(self.lock_prefix + key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                return token
+            return None
+        except Exception as e:
+            logger.warning("Media cache lock unavailable, downloading without it: %s", e)
+            return token
+
+    def _release(self, key, token):
+        if self._redis is None:
+            return
+        try:
+            self._release_script(keys=[self.lock_prefix + key], args=[token])
+        except Exception as e:
+            logger.warning("Failed to release media cache lock %s: %s", key, e)
+
+    def ensure_janitor(self):
+        """Start the eviction thread on first use, and again after a fork."""
+        pid = os.getpid()
+        if self._janitor_pid == pid and self._janitor.is_alive():
+            return
+        with self._locks_guard:
+            if self._janitor_pid == pid and self._janitor.is_alive():
+                return
+            self._janitor = threading.Thread(target=self._janitor_loop, name='media-cache-janitor', daemon=True)
+            self._janitor_pid = pid
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning("Media cache sweep failed: %s", e)
+            time.sleep(self.janitor_interval)
+
+    def sweep(self) -> int:
+        """Enforce the disk quota and drop expired job output. Returns bytes freed."""
+        freed = 0
+        now = time.time()
+        entries = []
+        pinned = 0
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                mtime = os.path.getmtime(path)
+                size = _tree_size(path)
+            except OSError:
+                continue
+            if name.startswith('.partial-'):
+                if now - mtime > self.lock_ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+                    freed += size
+                continue
+            if now - mtime < self.pin_seconds:
+                pinned += size  # Just used: a response may be about to read it
+                continue
+            entries.append((mtime, size, path))
+
+        total = pinned + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            freed += size
+
+        if os.path.isdir(self.jobs_folder):
+            for name in os.listdir(self.jobs_folder):
+                path = os.path.join(self.jobs_folder, name)
+                try:
+                    if now - os.path.getmtime(path) > self.job_ttl:
+                        freed += _tree_size(path)
+                        shutil.rmtree(path, ignore_errors=True)
+                except OSError:
+                    continue
+        if freed:
+            logger.info("Media cache sweep freed %d bytes", freed)
+        return freed
+
+
+class _KeyLock:
+    """Per-key lock shared by every thread interested in the key; dropped when the last one leaves."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+
+    def __enter__(self):
+        with self.cache._locks_guard:
+            entry = self.cache._locks.setdefault(self.key, [threading.Lock(), 0])
+            entry[1] += 1
+        self.lock = entry[0]
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        with self.cache._locks_guard:
+            entry = self.cache._locks[self.key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.cache._locks[self.key]
+
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+media_cache = MediaCache()
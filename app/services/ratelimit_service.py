@@ -1,16 +1,208 @@
 # services/ratelimit_service.py
+import ipaddress
+import time
+from collections import namedtuple
+
+from limits.limits import TIME_TYPES
+
 from ..middlewares.extensions import limiter
 
+SCAN_COUNT = 1000  # Keys Redis examines per SCAN call
+UNLINK_BATCH = 500  # Keys unlinked per pipeline round trip
+
+LimitKey = namedtuple('LimitKey', ['key', 'identity', 'scope', 'amount', 'multiples', 'granularity', 'previous'])
+
+
+class RateLimitStorageUnavailable(Exception):
+    """Raised when the limiter is not backed by Redis, so there is nothing to administer."""
+
+
+def _redis():
+    client = getattr(limiter.storage, 'storage', None)
+    if client is None or not hasattr(client, 'scan_iter'):
+        raise RateLimitStorageUnavailable("Rate limits are not stored in Redis")
+    return client
+
+
+def _prefix() -> str:
+    return f"{getattr(limiter.storage, 'key_prefix', 'LIMITS')}:"
+
+
+def _escape(value: str) -> str:
+    """Escape glob metacharacters for a SCAN MATCH pattern."""
+    for char in '\\*?[]':
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+def parse_limit_key(key) -> LimitKey:
+    """
+    Split a limits storage key into its parts, or return None for foreign keys.
+
+    Keys look like ``LIMITS:LIMITER/<ip>/<scope...>/<amount>/<multiples>/<granularity>``;
+    sliding-window counters wrap everything after the prefix in braces and
+    keep the previous window under a ``/-1`` suffix.
+    """
+    if isinstance(key, bytes):
+        key = key.decode('utf-8', 'replace')
+    prefix = _prefix()
+    if not key.startswith(prefix):
+        return None
+    body = key[len(prefix):]
+    previous = body.endswith('}/-1')
+    if body.startswith('{'):
+        body = body[1:-4] if previous else body[1:-1]
+    parts = body.split('/')
+    if len(parts) < 5 or parts[0] != 'LIMITER':
+        return None
+    amount, multiples, granularity = parts[-3:]
+    if granularity not in TIME_TYPES or not amount.isdigit() or not multiples.isdigit():
+        return None
+    return LimitKey(key, parts[1], '/'.join(parts[2:-3]), int(amount), int(multiples), granularity, previous)
+
+
+def _patterns_for_ip(ip: str):
+    ip = str(ipaddress.ip_address(ip))
+    escaped = _escape(f"{_prefix()}LIMITER/{ip}/")
+    sliding = _escape(f"{_prefix()}{{LIMITER/{ip}/")
+    return [escaped + '*', sliding + '*']
+
+
+def iter_limit_keys(match=None):
+    """
+    Yield a ``LimitKey`` for every rate limit key, using cursor-based SCAN so
+    Redis is never blocked for longer than one small batch.
+    """
+    client = _redis()
+    for pattern in match or [_escape(_prefix()) + '*']:
+        for key in client.scan_iter(match=pattern, count=SCAN_COUNT):
+            parsed = parse_limit_key(key)
+            if parsed is not None:
+                yield parsed
+
+
+def _matcher(ips=(), networks=()):
+    addresses = set()
+    for ip in ips:
+        addresses.add(str(ipaddress.ip_address(ip)))
+    parsed_networks = [ipaddress.ip_network(network, strict=False) for network in networks]
+
+    def matches(identity):
+        if identity in addresses:
+            return True
+        if not parsed_networks:
+            return False
+        try:
+            address = ipaddress.ip_address(identity)
+        except ValueError:
+            return False
+        return any(address in network for network in parsed_networks)
+
+    return matches
+
+
+def _unlink(client, keys) -> int:
+    deleted = 0
+    for start in range(0, len(keys), UNLINK_BATCH):
+        pipe = client.pipeline(transaction=False)
+        for key in keys[start:start + UNLINK_BATCH]:
+            pipe.unlink(key)
+        deleted += sum(pipe.execute())
+    return deleted
+
+
+def reset_rate_limits(ips=(), networks=()) -> int:
+    """
+    Delete the rate limit keys of every listed IP and every IP inside the
+    listed CIDR ranges. Returns the number of keys deleted.
+
+    Raises ValueError for a malformed address or network.
+    """
+    matches = _matcher(ips, networks)
+    if networks or len(ips) > 1:
+        # One pass over the keyspace beats a targeted scan per address
+        candidates = iter_limit_keys()
+    else:
+        candidates = iter_limit_keys([pattern for ip in ips for pattern in _patterns_for_ip(ip)])
+    client = _redis()
+    keys, deleted = [], 0
+    for limit_key in candidates:
+        if matches(limit_key.identity):
+            keys.append(limit_key.key)
+            if len(keys) >= UNLINK_BATCH:
+                deleted += _unlink(client, keys)
+                keys = []
+    return deleted + _unlink(client, keys)
+
+
 def reset_rate_limit_for_ip(ip: str) -> int:
     """
     Delete all Redis keys for rate limiting of a given IP.
     Returns the number of keys deleted.
     """
-    # Access Redis client correctly:
-    redis_client = limiter.storage.storage  
-    
-    pattern = f"LIMITS:LIMITER/{ip}/*"
-    keys = redis_client.keys(pattern)
-    for key in keys:
-        redis_client.delete(key)
-    return len(keys)
+    return reset_rate_limits(ips=[ip])
+
+
+def inspect_rate_limits(ip: str = None, network: str = None, max_keys: int = 100):
+    """
+    Current window usage for up to ``max_keys`` rate limit keys, optionally
+    narrowed to one IP or CIDR range.
+
+    Usage is read per key type: fixed and sliding windows are counters,
+    moving windows are lists of request timestamps.
+    """
+    client = _redis()
+    if ip:
+        matches = _matcher(ips=[ip])
+        candidates = iter_limit_keys(_patterns_for_ip(ip))
+    else:
+        matches = _matcher(networks=[network]) if network else (lambda identity: True)
+        candidates = iter_limit_keys()
+
+    selected = []
+    for limit_key in candidates:
+        if matches(limit_key.identity):
+            selected.append(limit_key)
+            if len(selected) >= max_keys:
+                break
+    if not selected:
+        return []
+
+    pipe = client.pipeline(transaction=False)
+    for limit_key in selected:
+        pipe.type(limit_key.key)
+        pipe.pttl(limit_key.key)
+    meta = pipe.execute()
+
+    now = time.time()
+    pipe = client.pipeline(transaction=False)
+    for i, limit_key in enumerate(selected):
+        if meta[2 * i] in (b'list', 'list'):
+            pipe.lrange(limit_key.key, 0, limit_key.amount - 1)
+        else:
+            pipe.get(limit_key.key)
+    values = pipe.execute()
+
+    report = []
+    for i, limit_key in enumerate(selected):
+        window = limit_key.multiples * TIME_TYPES[limit_key.granularity].seconds
+        value = values[i]
+        if isinstance(value, list):
+            strategy = 'moving-window'
+            used = sum(1 for stamp in value if float(stamp) > now - window)
+        else:
+            strategy = 'sliding-window' if limit_key.key.startswith(_prefix() + '{') else 'fixed-window'
+            used = int(float(value or 0))
+        pttl = meta[2 * i + 1]
+        report.append({
+            'key': limit_key.key,
+            'ip': limit_key.identity,
+            'scope': limit_key.scope,
+            'limit': f"{limit_key.amount} per {limit_key.multiples} {limit_key.granularity}",
+            'strategy': strategy,
+            'previous_window': limit_key.previous,
+            'used': used,
+            'remaining': max(0, limit_key.amount - used),
+            'ttl': round(pttl / 1000.0, 3) if pttl and pttl > 0 else None,
+        })
+    return report
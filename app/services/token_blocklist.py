@@ -0,0 +1,188 @@
+import logging
+import os
+import threading
+import time
+
+from ..middlewares.extensions import jwt
+from ..utils.bloom import BloomFilter
+from ..utils.lru import TTLCache
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBlocklist:
+    """
+    Revoked JWT ids, stored in Redis until the token would have expired anyway.
+
+    Each process keeps a Bloom filter of revoked JTIs, so the common case,
+    a token that was never revoked, is answered without any network round
+    trip. Only a Bloom hit is confirmed against Redis. Revocations reach other
+    workers through pub/sub. The filter is rebuilt from Redis at startup,
+    every ``JWT_BLOCKLIST_REBUILD_INTERVAL`` seconds (dropping expired JTIs)
+    and whenever the listener may have missed messages. If Redis is
+    unreachable, checks fail open rather than logging everyone out.
+    """
+
+    def __init__(self, app=None):
+        self.key_prefix = 'revoked_jti:'
+        self.channel = 'token_blocklist:revoked'
+        self.bloom_capacity = 100_000
+        self.bloom_error_rate = 0.001
+        self.rebuild_interval = 3600
+        self.confirmed = TTLCache(maxsize=4096, ttl=60)
+        self._bloom = None
+        self._bloom_built_at = 0.0
+        self._rebuilding = False
+        self._pending = []
+        self._redis = None
+        self._listener = None
+        self._listener_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.key_prefix = app.config.get('CACHE_KEY_PREFIX', '') + 'revoked_jti:'
+        self.channel = app.config.get('JWT_BLOCKLIST_CHANNEL', self.channel)
+        self.bloom_capacity = app.config.get('JWT_BLOCKLIST_BLOOM_CAPACITY', self.bloom_capacity)
+        self.bloom_error_rate = app.config.get('JWT_BLOCKLIST_BLOOM_ERROR_RATE', self.bloom_error_rate)
+        self.rebuild_interval = app.config.get('JWT_BLOCKLIST_REBUILD_INTERVAL', self.rebuild_interval)
+        self._redis = get_redis(app)
+        self._bloom = None
+        jwt.token_in_blocklist_loader(self.is_token_revoked)
+        app.extensions['token_blocklist'] = self
+
+    def load(self) -> None:
+        """Subscribe to revocations and build the Bloom filter; until then every check asks Redis."""
+        if self._redis is not None:
+            self._ensure_listener()
+            self._rebuild_bloom()
+
+    def _key(self, jti: str) -> str:
+        return self.key_prefix + jti
+
+    def revoke(self, claims: dict) -> None:
+        """Revoke a decoded token until its ``exp``; tokens without ``jti`` or already expired are ignored."""
+        jti = claims.get('jti')
+        if not jti:
+            return
+        ttl = int(claims.get('exp', 0) - time.time()) + 1
+        if ttl <= 0:
+            return
+        self._add_revoked([jti])
+        self.confirmed.set(jti, True, ttl=min(self.confirmed.ttl, ttl))
+        if self._redis is None:
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.set(self._key(jti), b'1', ex=ttl)
+            pipe.publish(self.channel, jti)
+            pipe.execute()
+        except Exception as e:
+            # Only this process knows about the revocation now
+            logger.error("Failed to store revocation of %s: %s", jti, e)
+
+    def is_revoked(self, jti: str) -> bool:
+        if not jti or self._redis is None:
+            return False
+        self._ensure_listener()
+        bloom = self._bloom
+        if bloom is not None:
+            if time.monotonic() - self._bloom_built_at > self.rebuild_interval:
+                self._schedule_rebuild()
+            if jti not in bloom:
+                return False
+        if self.confirmed.get(jti):
+            return True
+        try:
+            revoked = bool(self._redis.exists(self._key(jti)))
+        except Exception as e:
+            logger.warning("Token blocklist check failed for %s: %s", jti, e)
+            return False
+        if revoked:
+            self.confirmed.set(jti, True)
+        return revoked
+
+    def is_token_revoked(self, jwt_header, jwt_payload) -> bool:
+        """``token_in_blocklist_loader`` callback."""
+        return self.is_revoked(jwt_payload.get('jti'))
+
+    def _add_revoked(self, jtis) -> None:
+        with self._lock:
+            if self._rebuilding:
+                self._pending.extend(jtis)
+        bloom = self._bloom
+        if bloom is not None:
+            bloom.update(jtis)
+
+    def _iter_revoked(self):
+        offset = len(self.key_prefix)
+        for key in self._redis.scan_iter(match=self.key_prefix + '*', count=1000):
+            yield (key.decode('utf-8') if isinstance(key, bytes) else key)[offset:]
+
+    def _schedule_rebuild(self) -> None:
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_bloom, name='token-bloom-rebuild', daemon=True).start()
+
+    def _rebuild_bloom(self) -> None:
+        with self._lock:
+            self._rebuilding = True
+        try:
+            bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+            bloom.update(self._iter_revoked())
+            with self._lock:
+                bloom.update(self._pending)
+                self._bloom = bloom
+                self._bloom_built_at = time.monotonic()
+            logger.info("Built token blocklist Bloom filter with %d revoked tokens", bloom.count)
+        except Exception as e:
+            # Without a filter every check goes to Redis.
+            self._bloom = None
+            logger.error("Failed to build token blocklist Bloom filter: %s", e)
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._pending = []
+
+    def _ensure_listener(self):
+        """Start the pub/sub listener on first use, and again after a fork."""
+        if self._redis is None:
+            return
+        pid = os.getpid()
+        if self._listener_pid == pid and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener_pid == pid and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='token-blocklist-listener', daemon=True)
+            self._listener_pid = pid
+            self._listener.start()
+
+    def _listen(self):
+        reconnecting = False
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if reconnecting:
+                    # Revocations published while we were not subscribed are lost.
+                    self._schedule_rebuild()
+                reconnecting = True
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message or message.get('type') != 'message':
+                        continue
+                    data = message['data']
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    self._add_revoked(data.split('\n'))
+            except Exception as e:
+                logger.warning("Token blocklist listener error: %s", e)
+                time.sleep(1)
+
+
+token_blocklist = TokenBlocklist()
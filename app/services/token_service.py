@@ -0,0 +1,221 @@
+import logging
+import time
+import uuid
+from collections import namedtuple
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token
+from flask_jwt_extended.config import config
+from werkzeug.exceptions import ServiceUnavailable
+
+from .token_blocklist import token_blocklist
+from .user_cache import user_cache, MISS
+from .user_service import UserService
+from ..utils.permissions import permission_registry
+from ..utils.redis_client import get_redis
+from ..utils.timing import timed
+
+logger = logging.getLogger(__name__)
+
+TokenPair = namedtuple('TokenPair', ['access_token', 'refresh_token', 'user'])
+
+# Rotation outcomes
+ROTATED = 1
+REUSED = 0
+UNKNOWN_FAMILY = -1
+SUPERSEDED = 2
+
+# KEYS: token family hash, user version stamp, cached user record.
+# ARGV: presented refresh jti, new refresh jti, family TTL, candidate version stamp, now, reuse grace seconds.
+# Returns {outcome[, version stamp, packed user record or false]}.
+ROTATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'cur')
+if not current then
+    return {-1}
+end
+if current ~= ARGV[1] then
+    local previous = redis.call('HMGET', KEYS[1], 'prev', 'at')
+    if previous[1] == ARGV[1] and tonumber(ARGV[5]) - tonumber(previous[2]) <= tonumber(ARGV[6]) then
+        -- A concurrent refresh from the same client, not a replay
+        return {2}
+    end
+    redis.call('DEL', KEYS[1])
+    return {0}
+end
+redis.call('HSET', KEYS[1], 'cur', ARGV[2], 'prev', ARGV[1], 'at', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+local version = redis.call('GET', KEYS[2])
+if not version then
+    version = ARGV[4]
+    redis.call('SET', KEYS[2], version)
+end
+return {1, version, redis.call('GET', KEYS[3])}
+"""
+
+_rotate_script = None
+
+
+class RefreshTokenError(Exception):
+    """Raised when a refresh token may not be exchanged for a new pair."""
+
+
+class RotationUnavailable(ServiceUnavailable):
+    """Raised when the token family cannot be rotated because Redis is unreachable."""
+    description = "Token refresh is temporarily unavailable, please retry shortly"
+
+
+def _family_key(family: str) -> str:
+    return current_app.config.get('CACHE_KEY_PREFIX', '') + 'token_family:' + family
+
+
+def _family_ttl() -> int:
+    return int(current_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds())
+
+
+def profile_claims(user) -> dict:
+    """The ``JWT_PROFILE_CLAIMS`` fields of a user, as embedded in access tokens."""
+    return {name: getattr(user, name, None) for name in current_app.config.get('JWT_PROFILE_CLAIMS', ())}
+
+
+def claims_are_stale(claims: dict) -> bool:
+    """
+    True when this process knows the user's claims version stamp has moved
+    past the token's, e.g. after a role change. Costs no I/O; a token whose
+    user has no known newer stamp is trusted until it expires.
+    """
+    known = user_cache.known_version(UserService.normalize_identifier(claims.get(config.identity_claim_key, '')))
+    return known is not None and known != claims.get('ver')
+
+
+def _issue(user, version: str, family: str, jti: str) -> TokenPair:
+    """Sign one access/refresh pair; both carry the user's version stamp, the refresh token its family."""
+    claims = {'role': user.role, 'ver': version}
+    user_cache.note_version(UserService.normalize_identifier(user.username), version)
+    with timed('jwt'):
+        access_token = create_access_token(
+            identity=user.username,
+            additional_claims=dict(profile_claims(user), perm=permission_registry.mask_for_role(user.role), **claims),
+        )
+        refresh_token = create_refresh_token(
+            identity=user.username,
+            additional_claims=dict(claims, fam=family, jti=jti),
+        )
+    return TokenPair(access_token, refresh_token, user)
+
+
+def start_session(user) -> TokenPair:
+    """
+    Issue the first pair of a new token family, as on login or registration.
+
+    The family's current refresh jti and the user's version stamp are written
+    in one pipelined round trip. Without Redis the pair is issued untracked.
+    """
+    family, jti = uuid.uuid4().hex, uuid.uuid4().hex
+    version = ''
+    redis_client = get_redis()
+    if redis_client is not None:
+        version_key = UserService.version_key(user.username)
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(version_key, UserService.new_version_stamp(), nx=True)
+            pipe.get(version_key)
+            pipe.hset(_family_key(family), mapping={'cur': jti})
+            pipe.expire(_family_key(family), _family_ttl())
+            _, stamp, _, _ = pipe.execute()
+            version = stamp.decode('utf-8') if stamp else ''
+        except Exception as e:
+            logger.error("Failed to record token family for %s: %s", user.username, e)
+    return _issue(user, version, family, jti)
+
+
+def _lookup_user(identity: str):
+    user = UserService.get_user_by_username_or_email(identity)
+    if not user:
+        raise RefreshTokenError("User not found")
+    return user
+
+
+def rotate(identity: str, claims: dict) -> TokenPair:
+    """
+    Exchange a refresh token for exactly one new pair.
+
+    Rotating the family, reading the user's version stamp and fetching the
+    cached user record is a single Redis script call. The user comes from the
+    local cache tier or the script's reply; Mongo is only asked when neither
+    has it. The stamp is copied into the new tokens' ``ver`` claim and changes
+    whenever the user's role does.
+
+    Presenting a refresh token that has already been rotated away is treated
+    as theft: the whole family is dropped, so neither the replayed token nor
+    the one issued in its place can be used again. A token rotated less than
+    ``JWT_REFRESH_REUSE_GRACE`` seconds ago is refused without revoking, so
+    two tabs refreshing at once do not log each other out.
+
+    If Redis fails mid-rotation the refresh is refused with a 503 rather than
+    issuing a token the family does not know: its next refresh would look
+    like reuse and revoke the family. The client keeps its current pair and
+    retries.
+
+    Raises RefreshTokenError when the token may not be refreshed, and
+    RotationUnavailable when it cannot be refreshed right now.
+    """
+    global _rotate_script
+    family = claims.get('fam')
+    redis_client = get_redis()
+    if redis_client is None:
+        return _issue(_lookup_user(identity), claims.get('ver', ''), family or uuid.uuid4().hex, uuid.uuid4().hex)
+    if not family:
+        # Issued before families existed: retire it and start one
+        token_blocklist.revoke(claims)
+        return start_session(_lookup_user(identity))
+
+    identifier = UserService.normalize_identifier(identity)
+    jti = uuid.uuid4().hex
+    try:
+        if _rotate_script is None or _rotate_script.registered_client is not redis_client:
+            _rotate_script = redis_client.register_script(ROTATE_SCRIPT)
+        reply = _rotate_script(
+            keys=[_family_key(family), UserService.version_key(identity), user_cache.redis_key(identifier)],
+            args=[
+                claims['jti'],
+                jti,
+                _family_ttl(),
+                UserService.new_version_stamp(),
+                int(time.time()),
+                current_app.config.get('JWT_REFRESH_REUSE_GRACE', 10),
+            ],
+        )
+    except Exception as e:
+        logger.error("Token family rotation failed for %s: %s", identity, e)
+        raise RotationUnavailable(retry_after=current_app.config.get('JWT_REFRESH_RETRY_AFTER', 1))
+
+    outcome = reply[0]
+    if outcome == REUSED:
+        logger.warning("Refresh token reuse detected for %s; revoked token family %s", identity, family)
+        raise RefreshTokenError("Refresh token reuse detected")
+    if outcome == SUPERSEDED:
+        raise RefreshTokenError("Refresh token already used")
+    if outcome != ROTATED:
+        raise RefreshTokenError("Refresh token is no longer valid")
+
+    user = user_cache.local.get(identifier, MISS)
+    if user is MISS and reply[2] is not None:
+        user = user_cache.from_redis(identifier, reply[2])
+    if user is MISS:
+        user = _lookup_user(identity)
+    elif user is None:
+        raise RefreshTokenError("User not found")
+    return _issue(user, reply[1].decode('utf-8'), family, jti)
+
+
+def end_session(claims: dict) -> None:
+    """Revoke a refresh token and drop its family, so no token of the family can be refreshed."""
+    token_blocklist.revoke(claims)
+    family = claims.get('fam')
+    redis_client = get_redis()
+    if not family or redis_client is None:
+        return
+    try:
+        redis_client.delete(_family_key(family))
+    except Exception as e:
+        logger.error("Failed to drop token family %s: %s", family, e)
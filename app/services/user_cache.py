@@ -0,0 +1,390 @@
+import logging
+import os
+import struct
+import threading
+import time
+
+from bson import ObjectId
+
+from .hashing_service import hashing_service
+from ..utils.bloom import BloomFilter
+from ..utils.lru import TTLCache
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Sentinel distinguishing "not cached" from a cached value (None means "known missing").
+MISS = object()
+
+# Redis value stored for identifiers known not to exist.
+_MISSING = b''
+
+# Pub/sub message kinds
+_INVALIDATE = 'inv'
+_KNOWN = 'add'
+_VERSION = 'ver'
+
+# KEYS: identifier key, generation key. ARGV: negative TTL, generation read before the lookup.
+# Records a miss only if no user was created since the lookup began.
+SET_MISSING_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '0') ~= ARGV[2] then
+    return 0
+end
+redis.call('set', KEYS[1], '', 'EX', ARGV[1])
+return 1
+"""
+
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('!B12s')
+_FIELD_LEN = struct.Struct('!H')
+
+
+class UserRecord:
+    """Slim, read-only projection of a ``User`` used on the authentication hot path."""
+    __slots__ = ('id', 'username', 'email', 'role', 'password_hash')
+
+    def __init__(self, id, username, email, role, password_hash):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.password_hash = password_hash
+
+    @classmethod
+    def from_document(cls, user):
+        return cls(user.id, user.username, user.email, user.role or 'user', user.password_hash)
+
+    @classmethod
+    def from_mongo(cls, doc: dict):
+        return cls(doc['_id'], doc['username'], doc['email'], doc.get('role') or 'user', doc['password_hash'])
+
+    def check_password(self, password):
+        return hashing_service.verify_password(self.password_hash, password)
+
+    def pack(self) -> bytes:
+        """Serialize as a version byte, the 12-byte ObjectId and length-prefixed UTF-8 fields."""
+        parts = [_HEADER.pack(_FORMAT_VERSION, ObjectId(self.id).binary)]
+        for value in (self.username, self.email, self.role, self.password_hash):
+            encoded = value.encode('utf-8')
+            parts.append(_FIELD_LEN.pack(len(encoded)))
+            parts.append(encoded)
+        return b''.join(parts)
+
+    @classmethod
+    def unpack(cls, data: bytes):
+        version, oid = _HEADER.unpack_from(data, 0)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported user record version {version}")
+        offset = _HEADER.size
+        fields = []
+        for _ in range(4):
+            (length,) = _FIELD_LEN.unpack_from(data, offset)
+            offset += _FIELD_LEN.size
+            fields.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        return cls(ObjectId(oid), *fields)
+
+
+class UserCache:
+    """
+    Two-tier cache for user lookups: a per-process TTL-bounded LRU in front of Redis.
+
+    Writes invalidate both tiers and publish the affected identifiers on
+    ``USER_CACHE_CHANNEL`` so every worker drops its local copy.
+
+    Lookups for identifiers that do not exist are cached too, for the shorter
+    ``USER_NEGATIVE_TTL``. In front of that, a Bloom filter of every known
+    username and email answers most unknown identifiers without any I/O. It is
+    built at startup from ``identifier_loader``, extended through pub/sub when
+    users are created, and rebuilt every ``USER_BLOOM_REBUILD_INTERVAL`` seconds
+    or whenever the listener may have missed messages. Until the filter is
+    loaded nothing is reported missing, so lookups made before the normalized
+    fields are backfilled cannot hide existing users. Every user creation bumps
+    a generation counter, and a miss is only recorded if the generation read
+    before the lookup is still current.
+
+    The cache also remembers each user's latest claims version stamp seen by
+    this process, for ``USER_VERSION_TTL`` seconds. New stamps are broadcast
+    on the same channel, so any worker can tell a token with stale claims
+    from a current one without asking Redis.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.key_prefix = 'user:'
+        self.channel = 'user_cache:invalidate'
+        self.negative_ttl = 60
+        self.bloom_capacity = 1_000_000
+        self.bloom_error_rate = 0.01
+        self.bloom_rebuild_interval = 3600
+        self.local = TTLCache(maxsize=1024, ttl=30)
+        self.versions = TTLCache(maxsize=10000, ttl=900)
+        self.identifier_loader = None
+        self._bloom = None
+        self._bloom_built_at = 0.0
+        self._rebuilding = False
+        self._pending_known = []
+        self._redis = None
+        self._set_missing_script = None
+        self.generation_key = 'user_gen'
+        self._local_generation = 0
+        self._listener = None
+        self._listener_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.key_prefix = app.config.get('CACHE_KEY_PREFIX', '') + 'user:'
+        self.channel = app.config.get('USER_CACHE_CHANNEL', self.channel)
+        self.local = TTLCache(
+            maxsize=app.config.get('USER_CACHE_LOCAL_SIZE', 1024),
+            ttl=app.config.get('USER_CACHE_LOCAL_TTL', 30),
+        )
+        self.versions = TTLCache(
+            maxsize=app.config.get('USER_VERSION_LOCAL_SIZE', 10000),
+            ttl=app.config.get('USER_VERSION_TTL', 900),
+        )
+        self.negative_ttl = app.config.get('USER_NEGATIVE_TTL', self.negative_ttl)
+        self.bloom_capacity = app.config.get('USER_BLOOM_CAPACITY', self.bloom_capacity)
+        self.bloom_error_rate = app.config.get('USER_BLOOM_ERROR_RATE', self.bloom_error_rate)
+        self.bloom_rebuild_interval = app.config.get('USER_BLOOM_REBUILD_INTERVAL', self.bloom_rebuild_interval)
+        self._bloom = None
+        self.generation_key = app.config.get('CACHE_KEY_PREFIX', '') + 'user_gen'
+        self._redis = get_redis(app)
+        self._set_missing_script = self._redis.register_script(SET_MISSING_SCRIPT) if self._redis is not None else None
+        app.extensions['user_cache'] = self
+
+    def load_known(self, identifier_loader) -> None:
+        """
+        Build the known-identifier Bloom filter now and keep it fresh with
+        ``identifier_loader``. Raises if the build fails, so a startup task can retry.
+        """
+        self.identifier_loader = identifier_loader
+        self._ensure_listener()
+        self._rebuild_bloom(raise_errors=True)
+
+    def _key(self, identifier: str) -> str:
+        return self.key_prefix + identifier
+
+    def get(self, identifier: str):
+        """
+        Return the cached ``UserRecord`` for an identifier, None if the identifier
+        is known not to exist, or ``MISS`` if the database has to be asked.
+        """
+        self._ensure_listener()
+        if not self.might_exist(identifier):
+            return None
+        record = self.local.get(identifier, MISS)
+        if record is not MISS or self._redis is None:
+            return record
+        try:
+            data = self._redis.get(self._key(identifier))
+        except Exception as e:
+            logger.warning("User cache read failed for %s: %s", identifier, e)
+            return MISS
+        if data is None:
+            return MISS
+        return self.from_redis(identifier, data)
+
+    def redis_key(self, identifier: str) -> str:
+        """Redis key of an identifier's shared-tier entry, for callers that read it inside a script."""
+        return self._key(identifier)
+
+    def from_redis(self, identifier: str, data: bytes):
+        """Decode a shared-tier value read elsewhere and keep it in the local tier; same results as ``get``."""
+        if data == _MISSING:
+            self.local.set(identifier, None, ttl=min(self.local.ttl, self.negative_ttl))
+            return None
+        try:
+            record = UserRecord.unpack(data)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            return MISS
+        self.local.set(identifier, record)
+        return record
+
+    def might_exist(self, identifier: str) -> bool:
+        """False only when the Bloom filter proves no user has this identifier."""
+        bloom = self._bloom
+        if bloom is None:
+            return True
+        if time.monotonic() - self._bloom_built_at > self.bloom_rebuild_interval:
+            self._schedule_rebuild()
+        return identifier in bloom
+
+    def generation(self):
+        """
+        Token to pass to ``set_missing``, read before looking an identifier up.
+        None while misses must not be recorded, i.e. before the Bloom filter is loaded.
+        """
+        if self._bloom is None:
+            return None
+        local = self._local_generation
+        if self._redis is None:
+            return local, None
+        try:
+            return local, (self._redis.get(self.generation_key) or b'0').decode()
+        except Exception as e:
+            logger.warning("User cache generation read failed: %s", e)
+            return None
+
+    def set_missing(self, identifier: str, generation) -> None:
+        """Remember, briefly, that no user has this identifier, unless a user was created since ``generation``."""
+        if generation is None or self._bloom is None:
+            return
+        local, shared = generation
+        if local == self._local_generation:
+            self.local.set(identifier, None, ttl=min(self.local.ttl, self.negative_ttl))
+        if self._redis is None:
+            return
+        try:
+            self._set_missing_script(keys=[self._key(identifier), self.generation_key], args=[self.negative_ttl, shared])
+        except Exception as e:
+            logger.warning("User cache write failed for %s: %s", identifier, e)
+
+    def set(self, identifier: str, record: UserRecord) -> None:
+        self.local.set(identifier, record)
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(self._key(identifier), record.pack(), ex=self.ttl)
+        except Exception as e:
+            logger.warning("User cache write failed for %s: %s", identifier, e)
+
+    def invalidate(self, *identifiers: str, known: bool = False) -> None:
+        """
+        Drop identifiers from both tiers here and from the local tier of every other worker.
+
+        Pass ``known=True`` when the identifiers now belong to a user, so they
+        are also added to every worker's Bloom filter.
+        """
+        identifiers = [i for i in identifiers if i]
+        if not identifiers:
+            return
+        for identifier in identifiers:
+            self.local.delete(identifier)
+        if known:
+            self._add_known(identifiers)
+        if self._redis is None:
+            return
+        kind = _KNOWN if known else _INVALIDATE
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            if known:
+                pipe.incr(self.generation_key)
+            pipe.delete(*[self._key(i) for i in identifiers])
+            pipe.publish(self.channel, '\n'.join([kind] + identifiers))
+            pipe.execute()
+        except Exception as e:
+            logger.warning("User cache invalidation failed for %s: %s", identifiers, e)
+
+    def note_version(self, identifier: str, stamp: str) -> None:
+        """Remember a user's current claims version stamp in this process only."""
+        if stamp:
+            self.versions.set(identifier, stamp)
+
+    def known_version(self, identifier: str):
+        """The latest claims version stamp this process has seen for a user, or None."""
+        return self.versions.get(identifier)
+
+    def publish_version(self, identifier: str, stamp: str) -> None:
+        """Tell every worker a user has a new claims version stamp."""
+        self.note_version(identifier, stamp)
+        if self._redis is None:
+            return
+        try:
+            self._redis.publish(self.channel, '\n'.join([_VERSION, identifier, stamp]))
+        except Exception as e:
+            logger.warning("User version broadcast failed for %s: %s", identifier, e)
+
+    def _add_known(self, identifiers) -> None:
+        with self._lock:
+            self._local_generation += 1
+            for identifier in identifiers:
+                # A lookup that raced the creation may have cached a miss after the invalidation
+                self.local.delete(identifier)
+            if self._rebuilding:
+                self._pending_known.extend(identifiers)
+        bloom = self._bloom
+        if bloom is not None:
+            bloom.update(identifiers)
+
+    def _schedule_rebuild(self) -> None:
+        with self._lock:
+            if self._rebuilding or self.identifier_loader is None:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_bloom, name='user-bloom-rebuild', daemon=True).start()
+
+    def _rebuild_bloom(self, raise_errors: bool = False) -> None:
+        if self.identifier_loader is None:
+            return
+        with self._lock:
+            self._rebuilding = True
+        try:
+            bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+            bloom.update(self.identifier_loader())
+            with self._lock:
+                bloom.update(self._pending_known)
+                self._bloom = bloom
+                self._bloom_built_at = time.monotonic()
+            logger.info("Built user Bloom filter with %d identifiers", bloom.count)
+        except Exception as e:
+            # Without a filter every lookup falls through to the caches and Mongo.
+            self._bloom = None
+            logger.error("Failed to build user Bloom filter: %s", e)
+            if raise_errors:
+                raise
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._pending_known = []
+
+    def _ensure_listener(self):
+        """Start the pub/sub listener on first use, and again after a fork."""
+        if self._redis is None:
+            return
+        pid = os.getpid()
+        if self._listener_pid == pid and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener_pid == pid and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='user-cache-invalidator', daemon=True)
+            self._listener_pid = pid
+            self._listener.start()
+
+    def _listen(self):
+        reconnecting = False
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if reconnecting:
+                    # Anything published while we were not subscribed is lost.
+                    self.local.clear()
+                    self._schedule_rebuild()
+                reconnecting = True
+                while True:
+                    # Poll instead of listen(): a blocking read would trip the pool's socket timeout
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message or message.get('type') != 'message':
+                        continue
+                    data = message['data']
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    kind, *identifiers = data.split('\n')
+                    if kind == _VERSION:
+                        self.note_version(*identifiers)
+                        continue
+                    for identifier in identifiers:
+                        self.local.delete(identifier)
+                    if kind == _KNOWN:
+                        self._add_known(identifiers)
+            except Exception as e:
+                logger.warning("User cache invalidation listener error: %s", e)
+                time.sleep(1)
+
+
+user_cache = UserCache()
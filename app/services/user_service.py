@@ -1,13 +1,102 @@
-from ..middlewares.extensions import cache
+from flask import current_app
 from ..models.user import User
+from .hashing_service import hashing_service, HashingBusyError
+from werkzeug.exceptions import TooManyRequests
+from .user_cache import user_cache, UserRecord, MISS
 from mongoengine.errors import NotUniqueError
+from mongoengine.queryset.visitor import Q
+from ..utils.permissions import permission_registry
+from ..utils.redis_client import get_redis
+from collections import namedtuple
 import logging
 import re
-from flask_caching.backends.rediscache import RedisCache
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+LoginAttempts = namedtuple('LoginAttempts', ['identifier', 'ip', 'blocked', 'retry_after'])
+
+# KEYS: identifier counter, optional IP counter.
+# ARGV: window seconds, now in ms, sliding flag, unique member, identifier limit, IP limit, record flag.
+# With the record flag set a failed attempt is counted first; either way the counts decide whether the
+# next attempt is blocked, and for how many more seconds.
+LOGIN_ATTEMPT_SCRIPT = """
+local window = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local sliding = ARGV[3] == '1'
+local record = ARGV[7] == '1'
+
+local function hit(key)
+    if sliding then
+        redis.call('ZADD', key, now, ARGV[4])
+        redis.call('PEXPIRE', key, window * 1000)
+        return
+    end
+    local count = redis.call('INCR', key)
+    if count == 1 or redis.call('TTL', key) < 0 then
+        redis.call('EXPIRE', key, window)
+    end
+end
+
+local function count(key)
+    if sliding then
+        redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window * 1000)
+        return redis.call('ZCARD', key)
+    end
+    return tonumber(redis.call('GET', key) or '0')
+end
+
+local function retry_after(key)
+    if sliding then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        return math.ceil((tonumber(oldest[2]) + window * 1000 - now) / 1000)
+    end
+    return math.max(redis.call('TTL', key), 1)
+end
+
+if record then
+    for _, key in ipairs(KEYS) do
+        hit(key)
+    end
+end
+local identifier_count = count(KEYS[1])
+local ip_count = 0
+if #KEYS > 1 then
+    ip_count = count(KEYS[2])
+end
+local wait = 0
+if identifier_count >= tonumber(ARGV[5]) then
+    wait = retry_after(KEYS[1])
+end
+if #KEYS > 1 and ip_count >= tonumber(ARGV[6]) then
+    wait = math.max(wait, retry_after(KEYS[2]))
+end
+return {identifier_count, ip_count, wait}
+"""
+
+_login_attempt_script = None
+
+
+class LoginLockedError(TooManyRequests):
+    """Raised when an identifier or client IP has too many recent failed logins."""
+    description = "Too many login attempts, please try again later"
+
+
 class UserService:
+    # Fields fetched for a lookup; everything else stays on the server
+    LOOKUP_FIELDS = ('username', 'email', 'role', 'password_hash')
+
+    @staticmethod
+    def normalize_identifier(identifier: str) -> str:
+        """Lower-case form of a username or email, as stored in the normalized fields."""
+        return identifier.strip().lower()
+
+    @staticmethod
+    def _identifier_query(identifier: str):
+        normalized = UserService.normalize_identifier(identifier)
+        return User.objects(Q(username_lower=normalized) | Q(email_lower=normalized))
+
     @staticmethod
     def validate_username(username: str) -> None:
         """Validate username format."""
@@ -33,14 +122,38 @@ class UserService:
             raise ValueError("Password must contain at least one uppercase letter and one number")
 
     @staticmethod
-    @cache.memoize(timeout=300)
-    def get_user_by_username_or_email(identifier: str) -> User:
-        """Retrieve a user by username or email."""
+    def validate_role(role: str) -> None:
+        if not permission_registry.is_role(role):
+            raise ValueError(f"Unknown role '{role}'")
+
+    @staticmethod
+    def get_user_by_username_or_email(identifier: str) -> UserRecord:
+        """Retrieve a user by username or email with a single indexed, projected query."""
+        key = UserService.normalize_identifier(identifier)
+        record = user_cache.get(key)
+        if record is not MISS:
+            return record
+        generation = user_cache.generation()
         try:
-            return User.objects(username=identifier).first() or User.objects(email=identifier).first()
+            doc = UserService._identifier_query(identifier).only(*UserService.LOOKUP_FIELDS).as_pymongo().first()
         except Exception as e:
-            logger.error(f"Error fetching user by identifier {identifier}: {str(e)}", exc_info=True)
+            logger.error("Error fetching user by identifier %s: %s", identifier, e, exc_info=True)
             return None
+        if doc is None:
+            user_cache.set_missing(key, generation)
+            return None
+        record = UserRecord.from_mongo(doc)
+        user_cache.set(key, record)
+        return record
+
+    @staticmethod
+    def iter_known_identifiers():
+        """Yield every normalized username and email, for the user cache's Bloom filter."""
+        docs = User.objects.only('username_lower', 'email_lower').as_pymongo()
+        for doc in docs.batch_size(5000):
+            for field in ('username_lower', 'email_lower'):
+                if doc.get(field):
+                    yield doc[field]
 
     @staticmethod
     def create_user(username: str, email: str, password: str, role: str = 'user') -> User:
@@ -50,67 +163,161 @@ class UserService:
             UserService.validate_username(username)
             UserService.validate_email(email)
             UserService.validate_password(password)
+            UserService.validate_role(role)
 
             user = User(username=username, email=email, role=role)
             user.set_password(password)
             user.save()
-            cache.delete_memoized(UserService.get_user_by_username_or_email, username)
-            cache.delete_memoized(UserService.get_user_by_username_or_email, email)
-            logger.info(f"Created user: {username} ({email})")
+            user_cache.invalidate(user.username_lower, user.email_lower, known=True)
+            logger.info("Created user: %s (%s)", username, email)
             return user
         except NotUniqueError:
-            logger.warning(f"Failed to create user: username {username} or email {email} already exists")
+            logger.warning("Failed to create user: username %s or email %s already exists", username, email)
             raise ValueError("Username or email already exists")
+        except HashingBusyError:
+            raise
         except Exception as e:
-            logger.error(f"Error creating user {username}: {str(e)}", exc_info=True)
+            logger.error("Error creating user %s: %s", username, e, exc_info=True)
             raise
 
     @staticmethod
-    def increment_login_attempt(identifier: str) -> int:
-        """Increment login attempts for a user."""
+    def update_role(identifier: str, role: str) -> UserRecord:
+        """Change a user's role and invalidate every cached copy of the user."""
+        UserService.validate_role(role)
+        user = UserService._identifier_query(identifier).first()
+        if not user:
+            raise ValueError("User not found")
+        user.update(set__role=role)
+        user_cache.invalidate(user.username_lower, user.email_lower)
+        UserService.bump_version(user.username)
+        logger.info("Changed role of %s to %s", user.username, role)
+        user.role = role
+        return UserRecord.from_document(user)
+
+    @staticmethod
+    def version_key(username: str) -> str:
+        """Redis key of the user's version stamp, copied into tokens as the ``ver`` claim."""
+        return f"{current_app.config.get('CACHE_KEY_PREFIX', '')}user_ver:{UserService.normalize_identifier(username)}"
+
+    @staticmethod
+    def new_version_stamp() -> str:
+        return uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def bump_version(username: str) -> None:
+        """Give the user a new version stamp, marking tokens issued before now as stale."""
+        stamp = UserService.new_version_stamp()
         try:
-            key = f"login_attempts:{identifier}"
-            if isinstance(cache.cache, RedisCache):
-                attempts = cache.cache.incr(key)
-                if attempts == 1:
-                    cache.set(key, attempts, timeout=3600)  # 1-hour expiration
-                logger.debug(f"Login attempts for {identifier}: {attempts}")
-                return attempts
-            else:
-                logger.warning("Cache backend is not Redis. Skipping login attempt tracking.")
-                return 0
+            redis_client = get_redis()
+            if redis_client is not None:
+                redis_client.set(UserService.version_key(username), stamp)
+                user_cache.publish_version(UserService.normalize_identifier(username), stamp)
         except Exception as e:
-            logger.error(f"Failed to increment login attempts for {identifier}: {str(e)}", exc_info=True)
-            return 0
+            logger.error("Failed to bump version stamp for %s: %s", username, e)
+
+    @staticmethod
+    def _login_attempt_keys(identifier: str, ip: str = None) -> list:
+        prefix = current_app.config.get('CACHE_KEY_PREFIX', '')
+        prefix += 'login_attempts_sw:' if current_app.config.get('LOGIN_ATTEMPT_SLIDING') else 'login_attempts:'
+        keys = [f"{prefix}id:{UserService.normalize_identifier(identifier)}"]
+        if ip:
+            keys.append(f"{prefix}ip:{ip}")
+        return keys
+
+    @staticmethod
+    def _login_attempts(identifier: str, ip: str = None, record: bool = False) -> LoginAttempts:
+        """
+        Read, and with ``record`` first count a failure in, the failed-login
+        counters of an identifier and, optionally, the client IP.
+
+        Counting, expiry and the threshold check run as one Redis script, so
+        concurrent attempts cannot lose the key's TTL or reset its count. A
+        login checks before verifying the password and, on a failure, records
+        after it: one round trip for a clean success, two for anything else.
+        """
+        global _login_attempt_script
+        redis_client = get_redis()
+        if redis_client is None:
+            logger.warning("Cache backend is not Redis. Skipping login attempt tracking.")
+            return LoginAttempts(0, 0, False, 0)
+        try:
+            if _login_attempt_script is None or _login_attempt_script.registered_client is not redis_client:
+                _login_attempt_script = redis_client.register_script(LOGIN_ATTEMPT_SCRIPT)
+            config = current_app.config
+            identifier_count, ip_count, retry_after = _login_attempt_script(
+                keys=UserService._login_attempt_keys(identifier, ip),
+                args=[
+                    config.get('LOGIN_ATTEMPT_WINDOW', 3600),
+                    int(time.time() * 1000),
+                    1 if config.get('LOGIN_ATTEMPT_SLIDING') else 0,
+                    uuid.uuid4().hex,
+                    config.get('LOGIN_MAX_ATTEMPTS', 5),
+                    config.get('LOGIN_MAX_ATTEMPTS_PER_IP', 100),
+                    1 if record else 0,
+                ],
+            )
+            logger.debug("Failed logins for %s: %s (ip %s: %s)", identifier, identifier_count, ip, ip_count)
+            return LoginAttempts(identifier_count, ip_count, retry_after > 0, retry_after)
+        except Exception as e:
+            logger.error("Failed to track login attempts for %s: %s", identifier, e, exc_info=True)
+            return LoginAttempts(0, 0, False, 0)
+
+    @staticmethod
+    def check_login_attempts(identifier: str, ip: str = None) -> LoginAttempts:
+        """Whether an identifier or client IP is locked out by earlier failed logins."""
+        return UserService._login_attempts(identifier, ip)
+
+    @staticmethod
+    def record_failed_login(identifier: str, ip: str = None) -> LoginAttempts:
+        """Count a failed login against an identifier and, optionally, the client IP."""
+        return UserService._login_attempts(identifier, ip, record=True)
 
     @staticmethod
     def reset_login_attempt(identifier: str) -> None:
-        """Reset login attempts for a user."""
+        """Reset failed logins of a user after a success. The per-IP counter is left to expire."""
         try:
-            key = f"login_attempts:{identifier}"
-            if isinstance(cache.cache, RedisCache):
-                cache.delete(key)
-                logger.debug(f"Reset login attempts for {identifier}")
+            redis_client = get_redis()
+            if redis_client is not None:
+                redis_client.delete(UserService._login_attempt_keys(identifier)[0])
+                logger.debug("Reset login attempts for %s", identifier)
         except Exception as e:
-            logger.error(f"Failed to reset login attempts for {identifier}: {str(e)}", exc_info=True)
+            logger.error("Failed to reset login attempts for %s: %s", identifier, e, exc_info=True)
 
     @staticmethod
-    def authenticate(identifier: str, password: str) -> User:
+    def upgrade_password_hash(user: UserRecord, password: str) -> None:
+        """Re-hash a verified password if its stored hash uses outdated parameters."""
+        if not hashing_service.needs_rehash(user.password_hash):
+            return
+        try:
+            password_hash = hashing_service.hash_password(password)
+            User.objects(id=user.id).update_one(set__password_hash=password_hash)
+            user_cache.invalidate(user.username.lower(), user.email.lower())
+            logger.info("Upgraded password hash for %s to %s", user.username, hashing_service.scheme)
+        except Exception as e:
+            # A failed upgrade must never fail the login; retry on the next one.
+            logger.warning("Failed to upgrade password hash for %s: %s", user.username, e)
+
+    @staticmethod
+    def authenticate(identifier: str, password: str, ip: str = None) -> UserRecord:
         """Authenticate a user by username or email."""
         try:
-            attempts = UserService.increment_login_attempt(identifier)
-            max_attempts = 5
-            if attempts > max_attempts:
-                logger.warning(f"Too many login attempts for {identifier}")
-                raise ValueError("Too many login attempts, please try again later")
+            attempts = UserService.check_login_attempts(identifier, ip)
+            if attempts.blocked:
+                logger.warning("Too many login attempts for %s", identifier)
+                raise LoginLockedError(retry_after=attempts.retry_after)
 
             user = UserService.get_user_by_username_or_email(identifier)
             if user and user.check_password(password):
-                UserService.reset_login_attempt(identifier)
-                logger.info(f"Successful authentication for {identifier}")
+                if attempts.identifier:
+                    UserService.reset_login_attempt(identifier)
+                UserService.upgrade_password_hash(user, password)
+                logger.info("Successful authentication for %s", identifier)
                 return user
-            logger.warning(f"Failed authentication attempt for {identifier}")
+            UserService.record_failed_login(identifier, ip)
+            logger.warning("Failed authentication attempt for %s", identifier)
             return None
+        except (HashingBusyError, LoginLockedError):
+            raise
         except Exception as e:
-            logger.error(f"Authentication error for {identifier}: {str(e)}", exc_info=True)
+            logger.error("Authentication error for %s: %s", identifier, e, exc_info=True)
             raise
\ No newline at end of file
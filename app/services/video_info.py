@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import zlib
+
+from . import download_service
+from ..utils.lru import TTLCache
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+INFO_FIELDS = (
+    'id', 'title', 'extractor', 'extractor_key', 'webpage_url', 'duration', 'uploader',
+    'channel', 'channel_id', 'thumbnail', 'upload_date', 'view_count', 'is_live', 'description',
+)
+FORMAT_FIELDS = (
+    'format_id', 'ext', 'resolution', 'width', 'height', 'fps', 'vcodec', 'acodec',
+    'tbr', 'filesize', 'filesize_approx', 'format_note',
+)
+ENTRY_FIELDS = ('id', 'title', 'url', 'duration', 'uploader', 'thumbnails')
+
+
+def slim_info(info: dict) -> dict:
+    """Keep what a preview or format picker needs; raw yt-dlp info can run to megabytes."""
+    slim = {name: info.get(name) for name in INFO_FIELDS if info.get(name) is not None}
+    slim['type'] = info.get('_type') or 'video'
+    if info.get('formats'):
+        slim['formats'] = [
+            {name: fmt.get(name) for name in FORMAT_FIELDS if fmt.get(name) is not None}
+            for fmt in info['formats']
+        ]
+    if slim['type'] == 'playlist':
+        entries = [entry for entry in (info.get('entries') or []) if entry]
+        slim['entries'] = [
+            {name: entry.get(name) for name in ENTRY_FIELDS if entry.get(name) is not None}
+            for entry in entries
+        ]
+        slim['entry_count'] = info.get('playlist_count') or len(entries)
+    return slim
+
+
+class VideoInfoCache:
+    """
+    Metadata-only yt-dlp extraction with a two-tier cache.
+
+    Slimmed results are stored in Redis as zlib-compressed JSON for
+    ``VIDEO_INFO_TTL`` seconds and fronted by a small in-process LRU, so repeat
+    lookups of a URL cost neither an extractor round trip nor, usually, a
+    Redis read. Playlists and channels are extracted flat: only the entry
+    list is fetched, never each entry's page.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 600
+        self.key_prefix = 'video_info:'
+        self.local = TTLCache(maxsize=256, ttl=60)
+        self._redis = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('VIDEO_INFO_TTL', self.ttl)
+        self.key_prefix = app.config.get('CACHE_KEY_PREFIX', '') + 'video_info:'
+        self.local = TTLCache(
+            maxsize=app.config.get('VIDEO_INFO_LOCAL_SIZE', 256),
+            ttl=app.config.get('VIDEO_INFO_LOCAL_TTL', 60),
+        )
+        self._redis = get_redis(app)
+        app.extensions['video_info'] = self
+
+    def _key(self, url: str, playlist: bool) -> str:
+        digest = hashlib.sha256(f"{int(playlist)}:{url}".encode('utf-8')).hexdigest()
+        return self.key_prefix + digest
+
+    def get(self, url: str, playlist: bool = True):
+        """
+        Slimmed metadata for ``url``, or None if yt-dlp could not extract it.
+
+        With ``playlist=False`` a video URL that also names a playlist resolves
+        to just the video, as it does for downloads.
+        """
+        key = self._key(url, playlist)
+        info = self.local.get(key)
+        if info is not None:
+            return info
+        info = self._read(key)
+        if info is None:
+            raw = download_service.extract_info(url, playlist=playlist)
+            if not raw:
+                return None
+            info = slim_info(raw)
+            self._write(key, info)
+        self.local.set(key, info)
+        return info
+
+    def _read(self, key):
+        if self._redis is None:
+            return None
+        try:
+            data = self._redis.get(key)
+            return json.loads(zlib.decompress(data)) if data else None
+        except Exception as e:
+            logger.warning("Video info cache read failed: %s", e)
+            return None
+
+    def _write(self, key, info):
+        if self._redis is None:
+            return
+        try:
+            payload = zlib.compress(json.dumps(info, separators=(',', ':')).encode('utf-8'))
+            self._redis.set(key, payload, ex=self.ttl)
+        except Exception as e:
+            logger.warning("Video info cache write failed: %s", e)
+
+
+video_info = VideoInfoCache()
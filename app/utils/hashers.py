@@ -0,0 +1,234 @@
+import time
+import logging
+from abc import ABC, abstractmethod
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Scheme name -> hasher instance. Populated by register_hasher().
+HASHERS = {}
+
+
+class Hasher(ABC):
+    """
+    Base class for a password hashing scheme.
+
+    Subclasses describe how to encode a password for a given set of cost
+    parameters, how to recognise and verify their own encoded hashes, and how
+    to step the cost up during calibration.
+    """
+    name = None
+    default_params = {}
+    min_params = {}
+
+    @abstractmethod
+    def encode(self, password: str, params: dict) -> str:
+        ...
+
+    @abstractmethod
+    def verify(self, password: str, encoded: str) -> bool:
+        ...
+
+    @abstractmethod
+    def identify(self, encoded: str) -> bool:
+        ...
+
+    @abstractmethod
+    def params_of(self, encoded: str) -> dict:
+        ...
+
+    @abstractmethod
+    def stronger(self, params: dict) -> dict:
+        """Return the next, more expensive, parameter set or None at the ceiling."""
+
+
+class ScryptHasher(Hasher):
+    name = 'scrypt'
+    default_params = {'n': 2 ** 15, 'r': 8, 'p': 1}
+    min_params = {'n': 2 ** 14, 'r': 8, 'p': 1}
+    max_n = 2 ** 20
+
+    def encode(self, password, params):
+        method = f"scrypt:{params['n']}:{params['r']}:{params['p']}"
+        return generate_password_hash(password, method=method)
+
+    def verify(self, password, encoded):
+        return check_password_hash(encoded, password)
+
+    def identify(self, encoded):
+        return encoded.startswith('scrypt:')
+
+    def params_of(self, encoded):
+        method = encoded.split('$', 1)[0]
+        parts = method.split(':')[1:]
+        if len(parts) != 3:
+            return dict(self.default_params)
+        n, r, p = map(int, parts)
+        return {'n': n, 'r': r, 'p': p}
+
+    def stronger(self, params):
+        if params['n'] >= self.max_n:
+            return None
+        return dict(params, n=params['n'] * 2)
+
+
+class Pbkdf2Hasher(Hasher):
+    name = 'pbkdf2'
+    default_params = {'hash_name': 'sha256', 'iterations': 1_000_000}
+    min_params = {'hash_name': 'sha256', 'iterations': 600_000}
+    max_iterations = 10_000_000
+
+    def encode(self, password, params):
+        method = f"pbkdf2:{params['hash_name']}:{params['iterations']}"
+        return generate_password_hash(password, method=method)
+
+    def verify(self, password, encoded):
+        return check_password_hash(encoded, password)
+
+    def identify(self, encoded):
+        return encoded.startswith('pbkdf2:')
+
+    def params_of(self, encoded):
+        parts = encoded.split('$', 1)[0].split(':')[1:]
+        hash_name = parts[0] if parts else 'sha256'
+        iterations = int(parts[1]) if len(parts) > 1 else self.default_params['iterations']
+        return {'hash_name': hash_name, 'iterations': iterations}
+
+    def stronger(self, params):
+        if params['iterations'] >= self.max_iterations:
+            return None
+        return dict(params, iterations=int(params['iterations'] * 1.5))
+
+
+class BcryptHasher(Hasher):
+    name = 'bcrypt'
+    default_params = {'rounds': 12}
+    min_params = {'rounds': 10}
+    max_rounds = 16
+
+    def encode(self, password, params):
+        import bcrypt
+        salt = bcrypt.gensalt(rounds=params['rounds'])
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, encoded):
+        import bcrypt
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), encoded.encode('utf-8'))
+        except ValueError:
+            return False
+
+    def identify(self, encoded):
+        return encoded.startswith(('$2a$', '$2b$', '$2y$'))
+
+    def params_of(self, encoded):
+        return {'rounds': int(encoded.split('$')[2])}
+
+    def stronger(self, params):
+        if params['rounds'] >= self.max_rounds:
+            return None
+        return dict(params, rounds=params['rounds'] + 1)
+
+
+class Argon2Hasher(Hasher):
+    """Argon2id via the optional ``argon2-cffi`` package."""
+    name = 'argon2'
+    default_params = {'time_cost': 3, 'memory_cost': 65536, 'parallelism': 4}
+    min_params = {'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1}
+    max_time_cost = 16
+
+    def _hasher(self, params):
+        from argon2 import PasswordHasher
+        return PasswordHasher(**params)
+
+    def encode(self, password, params):
+        return self._hasher(params).hash(password)
+
+    def verify(self, password, encoded):
+        from argon2.exceptions import VerificationError, InvalidHashError
+        try:
+            return self._hasher(self.params_of(encoded)).verify(encoded, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def identify(self, encoded):
+        return encoded.startswith('$argon2')
+
+    def params_of(self, encoded):
+        from argon2 import extract_parameters
+        parsed = extract_parameters(encoded)
+        return {'time_cost': parsed.time_cost, 'memory_cost': parsed.memory_cost,
+                'parallelism': parsed.parallelism}
+
+    def stronger(self, params):
+        if params['time_cost'] >= self.max_time_cost:
+            return None
+        return dict(params, time_cost=params['time_cost'] + 1)
+
+
+def register_hasher(hasher: Hasher) -> None:
+    """Make a hashing scheme available under its name."""
+    HASHERS[hasher.name] = hasher
+
+
+def get_hasher(name: str) -> Hasher:
+    try:
+        return HASHERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown password hash scheme: {name}")
+
+
+def identify_hasher(encoded: str):
+    """Return the hasher that produced an encoded hash, or None."""
+    if not encoded:
+        return None
+    for hasher in HASHERS.values():
+        if hasher.identify(encoded):
+            return hasher
+    return None
+
+
+def hash_with(scheme: str, params: dict, password: str) -> str:
+    """Hash a password. Module level so it can be sent to a process pool."""
+    return get_hasher(scheme).encode(password, params)
+
+
+def verify_any(encoded: str, password: str) -> bool:
+    """Verify a password against a hash produced by any registered scheme."""
+    hasher = identify_hasher(encoded)
+    if hasher is None:
+        return False
+    return hasher.verify(password, encoded)
+
+
+def calibrate(scheme: str, budget_ms: float, start_params: dict = None) -> dict:
+    """
+    Pick the strongest parameters whose hash time stays within ``budget_ms``.
+
+    Starts from the scheme's minimum (or ``start_params``) and steps the cost up
+    until the next step would exceed the budget. The minimum is always kept as
+    a floor, even on hardware too slow to meet the budget with it.
+    """
+    hasher = get_hasher(scheme)
+    params = dict(start_params or hasher.min_params)
+    while True:
+        candidate = hasher.stronger(params)
+        if candidate is None:
+            return params
+        start = time.perf_counter()
+        hasher.encode('calibration-Passw0rd', candidate)
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.debug("Calibrating %s: %s took %.1fms", scheme, candidate, elapsed)
+        if elapsed > budget_ms:
+            return params
+        params = candidate
+
+
+register_hasher(ScryptHasher())
+register_hasher(Pbkdf2Hasher())
+register_hasher(BcryptHasher())
+try:
+    import argon2  # noqa: F401
+    register_hasher(Argon2Hasher())
+except ImportError:
+    pass
@@ -0,0 +1,56 @@
+import os
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.utils import send_file as werkzeug_send_file
+
+OFFLOAD_MODES = ('x-accel', 'x-sendfile')
+
+
+def serve_media(path, download_name=None, as_attachment=True):
+    """
+    Response for a file under ``DOWNLOAD_FOLDER``.
+
+    Served directly, the response honours Range/If-Range and revalidates with
+    ETag and Last-Modified; the body is handed to the server's
+    ``wsgi.file_wrapper`` so gunicorn can use ``sendfile``. With
+    ``MEDIA_OFFLOAD`` set to ``x-accel`` (nginx) or ``x-sendfile``
+    (Apache/lighttpd) only headers are returned and the front proxy streams
+    the bytes, including any ranges. Conditional GETs are still answered here
+    so an unchanged file costs the proxy nothing.
+    """
+    download_name = download_name or os.path.basename(path)
+    max_age = current_app.config.get('MEDIA_MAX_AGE') or None
+    mode = (current_app.config.get('MEDIA_OFFLOAD') or '').lower()
+    internal_uri = _internal_uri(path) if mode == 'x-accel' else None
+
+    if mode not in OFFLOAD_MODES or (mode == 'x-accel' and internal_uri is None):
+        return send_file(path, as_attachment=as_attachment, download_name=download_name,
+                         conditional=True, etag=True, max_age=max_age)
+
+    path = os.path.abspath(path)
+    response = werkzeug_send_file(
+        path, request.environ, as_attachment=as_attachment, download_name=download_name,
+        conditional=False, etag=True, max_age=max_age, use_x_sendfile=True,
+        response_class=current_app.response_class,
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.make_conditional(request.environ)
+    if response.status_code != 200:
+        response.headers.pop('X-Sendfile', None)
+    elif internal_uri is not None:
+        # nginx sets the length from the file it serves
+        response.headers.pop('X-Sendfile', None)
+        response.headers.pop('Content-Length', None)
+        response.headers['X-Accel-Redirect'] = internal_uri
+    return response
+
+
+def _internal_uri(path):
+    """nginx internal location for ``path``, or None if it lies outside DOWNLOAD_FOLDER."""
+    root = os.path.realpath(current_app.config['DOWNLOAD_FOLDER'])
+    relative = os.path.relpath(os.path.realpath(path), root)
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return None
+    prefix = current_app.config.get('MEDIA_OFFLOAD_PREFIX', '/protected-media/').rstrip('/')
+    return f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
@@ -0,0 +1,73 @@
+import logging
+from enum import IntFlag
+
+logger = logging.getLogger(__name__)
+
+
+class Permission(IntFlag):
+    """Everything a token can be allowed to do, one bit each. Append new members; never renumber."""
+    ADMIN_ACCESS = 1 << 0
+    MANAGE_USERS = 1 << 1
+    MANAGE_RATE_LIMITS = 1 << 2
+    VIEW_STATS = 1 << 3
+
+
+ALL_PERMISSIONS = Permission(sum(Permission))
+
+
+def compile_permissions(names) -> int:
+    """
+    Bitmask of permission names, e.g. ``['manage_users', 'view_stats']``;
+    ``'*'`` grants everything. Raises ValueError for an unknown name.
+    """
+    if isinstance(names, (str, Permission)):
+        names = [names]
+    mask = 0
+    for name in names:
+        if isinstance(name, Permission):
+            mask |= name
+        elif name == '*':
+            mask |= ALL_PERMISSIONS
+        else:
+            try:
+                mask |= Permission[name.upper()]
+            except KeyError:
+                raise ValueError(f"Unknown permission '{name}'") from None
+    return int(mask)
+
+
+def permission_names(mask: int) -> list:
+    return [permission.name.lower() for permission in Permission if mask & permission]
+
+
+class PermissionRegistry:
+    """
+    Role to permission-mask table, compiled once from ``ROLE_PERMISSIONS``.
+
+    Tokens carry the mask of the user's role in a ``perm`` claim, so a
+    permission check is a single bit test with no lookups. Roles missing
+    from the table get no permissions.
+    """
+
+    def __init__(self, app=None):
+        self.role_masks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.role_masks = {
+            role: compile_permissions(names)
+            for role, names in app.config.get('ROLE_PERMISSIONS', {}).items()
+        }
+        app.extensions['permissions'] = self
+        logger.info("Compiled permissions for roles: %s", ', '.join(sorted(self.role_masks)) or 'none')
+
+    def mask_for_role(self, role) -> int:
+        return self.role_masks.get(role, 0)
+
+    def is_role(self, role) -> bool:
+        """True for roles defined in ``ROLE_PERMISSIONS``; users may only be given those."""
+        return role in self.role_masks
+
+
+permission_registry = PermissionRegistry()
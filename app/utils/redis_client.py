@@ -0,0 +1,18 @@
+from flask import current_app
+from flask_caching.backends.rediscache import RedisCache
+from ..middlewares.extensions import cache
+
+
+def get_redis(app=None):
+    """
+    Return the raw Redis client behind the Flask-Caching backend.
+
+    Pass ``app`` when calling outside an application context. Returns None
+    when the cache is not Redis-backed (e.g. Redis was unreachable at startup
+    and the cache fell back to ``null``), so callers can degrade.
+    """
+    app = app or current_app
+    backend = app.extensions.get('cache', {}).get(cache)
+    if isinstance(backend, RedisCache):
+        return backend._write_client
+    return None
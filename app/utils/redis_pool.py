@@ -0,0 +1,117 @@
+import threading
+import time
+
+import redis
+
+from .timing import record
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Bounded connection pool that records how busy it is.
+
+    Callers block for up to ``timeout`` seconds when every connection is in
+    use instead of opening more, so one worker can never hold more than
+    ``max_connections`` sockets. Counters are per process and restart when a
+    forked child resets the pool.
+    """
+
+    def reset(self):
+        super().reset()
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+
+    def get_connection(self, *args, **kwargs):
+        would_wait = self.pool.empty()
+        start = time.perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except redis.exceptions.ConnectionError:
+            if would_wait:
+                with self._stats_lock:
+                    self.waits += 1
+                    self.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            if would_wait:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+        connection.checked_out_at = start
+        return connection
+
+    def release(self, connection):
+        # Checkout to release spans the whole command or pipeline, waiting included
+        checked_out_at = getattr(connection, 'checked_out_at', None)
+        if checked_out_at is not None:
+            record('redis', time.perf_counter() - checked_out_at)
+            connection.checked_out_at = None
+        super().release(connection)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            idle_slots = self.pool.qsize()
+            created = len(self._connections)
+            served = self.waits - self.timeouts
+            return {
+                'max_connections': self.max_connections,
+                'created': created,
+                'in_use': self.max_connections - idle_slots,
+                'idle': max(0, created - (self.max_connections - idle_slots)),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_time_total_ms': round(self.wait_time * 1000, 3),
+                'wait_time_avg_ms': round(self.wait_time * 1000 / served, 3) if served else 0.0,
+                'wait_time_max_ms': round(self.max_wait_time * 1000, 3),
+            }
+
+
+class RedisPoolManager:
+    """
+    The process's single Redis connection pool, shared by the cache, the rate
+    limiter, sessions and every service that talks to Redis.
+
+    Connections are health-checked after sitting idle for
+    ``REDIS_HEALTH_CHECK_INTERVAL`` seconds and use explicit socket timeouts,
+    so a stalled Redis surfaces as an error instead of a hung worker. Size
+    ``REDIS_MAX_CONNECTIONS`` per worker: long-lived consumers such as the
+    user cache's pub/sub listener hold one connection permanently.
+    """
+
+    def __init__(self, app=None):
+        self.pool = None
+        self.client = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.pool = InstrumentedConnectionPool.from_url(
+            config['REDIS_URL'],
+            max_connections=config.get('REDIS_MAX_CONNECTIONS', 20),
+            timeout=config.get('REDIS_POOL_TIMEOUT', 2),
+            socket_timeout=config.get('REDIS_SOCKET_TIMEOUT', 2),
+            socket_connect_timeout=config.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2),
+            socket_keepalive=True,
+            health_check_interval=config.get('REDIS_HEALTH_CHECK_INTERVAL', 30),
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        app.extensions['redis_pool'] = self
+
+    def reset(self) -> None:
+        """Drop connections inherited from the parent process; new ones open on first use."""
+        if self.pool is not None:
+            self.pool.reset()
+
+    def stats(self) -> dict:
+        return self.pool.stats() if self.pool is not None else {}
+
+
+redis_pool = RedisPoolManager()
@@ -1,13 +1,16 @@
-from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, get_jwt_identity
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
 from functools import wraps
 from flask_restx import abort
 import logging
 
+from ..services.token_service import start_session, claims_are_stale
+from .permissions import compile_permissions, permission_names, permission_registry
+
 logger = logging.getLogger(__name__)
 
 def generate_tokens(user):
     """
-    Generate JWT access and refresh tokens for a user.
+    Generate JWT access and refresh tokens for a user, starting a new token family.
     
     Args:
         user: User object with username and role attributes.
@@ -23,15 +26,11 @@ def generate_tokens(user):
         raise ValueError("User object must have username and role attributes")
     
     try:
-        access_token = create_access_token(
-            identity=user.username,
-            additional_claims={'role': user.role}
-        )
-        refresh_token = create_refresh_token(identity=user.username)
-        logger.info(f"Generated tokens for user: {user.username}")
+        access_token, refresh_token, _ = start_session(user)
+        logger.debug("Generated tokens for user: %s", user.username)
         return access_token, refresh_token
     except Exception as e:
-        logger.error(f"Error generating tokens for user {user.username}: {str(e)}")
+        logger.error("Error generating tokens for user %s: %s", user.username, e)
         raise
 
 def role_required(role):
@@ -47,24 +46,59 @@ def role_required(role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                claims = get_jwt()
-                user_role = claims.get('role')
-                user_identity = get_jwt_identity()
-                
-                logger.info(f"Checking role for user: {user_identity}, required role: {role}, user role: {user_role}")
-                
-                if not user_role:
-                    logger.warning(f"No role found in JWT for user: {user_identity}")
-                    abort(403, message="Role information missing in token")
-                
-                if user_role != role:
-                    logger.warning(f"Access denied for user {user_identity}: required role {role}, found {user_role}")
-                    abort(403, message=f"Role '{role}' required")
-                
-                return f(*args, **kwargs)
-            except Exception as e:
-                logger.error(f"Error in role_required decorator: {str(e)}")
-                abort(401, message="Invalid or missing JWT")
+            claims = get_jwt()
+            user_role = claims.get('role')
+            user_identity = get_jwt_identity()
+
+            if not user_role:
+                logger.warning("No role found in JWT for user: %s", user_identity)
+                abort(403, message="Role information missing in token")
+
+            if user_role != role:
+                logger.debug("Access denied for user %s: required role %s, found %s", user_identity, role, user_role)
+                abort(403, message=f"Role '{role}' required")
+
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def permissions_required(any_of=(), all_of=()):
+    """
+    Decorator requiring a valid access token whose permission mask grants at
+    least one of ``any_of`` and every one of ``all_of``.
+    
+    Args:
+        any_of: Permission names or ``Permission`` members, one of which is enough.
+        all_of: Permission names or ``Permission`` members that are all required.
+    
+    Returns:
+        Decorator function that verifies the JWT and checks its ``perm`` claim.
+    
+    Raises:
+        ValueError: At decoration time, for an unknown permission name.
+    """
+    any_mask = compile_permissions(any_of)
+    all_mask = compile_permissions(all_of)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+            if claims_are_stale(claims):
+                abort(401, message="Token claims are stale, please refresh")
+            mask = claims.get('perm')
+            if mask is None:
+                # Issued before permission claims existed
+                mask = permission_registry.mask_for_role(claims.get('role'))
+
+            if mask & all_mask != all_mask or (any_mask and not mask & any_mask):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Access denied for user %s: has %s, required any of %s and all of %s",
+                                 get_jwt_identity(), permission_names(mask), permission_names(any_mask),
+                                 permission_names(all_mask))
+                abort(403, message="Insufficient permissions")
+
+            return f(*args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,182 @@
+import builtins
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Where worker boot time goes: wall time of each ``create_app`` step and,
+    when import tracking is on, the inclusive cost of each module imported
+    while the app package loaded.
+    """
+
+    def __init__(self):
+        self.import_seconds = None
+        self.steps = []
+        self.imports = {}
+        self._original_import = None
+        self._depth = 0
+
+    def reset(self) -> None:
+        """Forget the steps of an earlier ``create_app``; the one-off import cost is kept."""
+        self.steps = []
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def start_import_tracking(self) -> None:
+        """Time every first import until ``stop_import_tracking``; nested imports count towards their importer."""
+        if self._original_import is not None:
+            return
+        original = self._original_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or self._depth or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._depth -= 1
+                self.imports[name] = self.imports.get(name, 0.0) + time.perf_counter() - start
+
+        builtins.__import__ = timed_import
+
+    def stop_import_tracking(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def as_dict(self, top: int = 15) -> dict:
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:top]
+        steps = ([('imports', self.import_seconds)] if self.import_seconds is not None else []) + self.steps
+        return {
+            'steps_ms': {name: round(seconds * 1000, 1) for name, seconds in steps},
+            'total_ms': round(sum(seconds for _, seconds in steps) * 1000, 1),
+            'slowest_imports_ms': {name: round(seconds * 1000, 1) for name, seconds in slowest},
+        }
+
+    def log(self) -> None:
+        report = self.as_dict()
+        logger.info("Startup took %sms: %s", report['total_ms'],
+                    ', '.join(f'{name} {ms}ms' for name, ms in report['steps_ms'].items()))
+        if report['slowest_imports_ms']:
+            logger.info("Slowest imports: %s",
+                        ', '.join(f'{name} {ms}ms' for name, ms in report['slowest_imports_ms'].items()))
+
+
+class Readiness:
+    """
+    Startup work that must not block serving, run on a background thread.
+
+    Each task is retried every ``STARTUP_RETRY_INTERVAL`` seconds until it
+    succeeds, in order, so later tasks can depend on earlier ones (indexes
+    need Mongo). The app is ready once every required task has succeeded;
+    ``/readyz`` answers 503 until then, and with ``STARTUP_GATE_REQUESTS``
+    other requests are refused too. A worker forked before the work finished
+    picks up the remaining tasks on its first request.
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.status = {}
+        self.retry_interval = 2.0
+        self.gate_requests = False
+        self._app = None
+        self._thread = None
+        self._thread_pid = None
+        self._finished_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.retry_interval = app.config.get('STARTUP_RETRY_INTERVAL', self.retry_interval)
+        self.gate_requests = app.config.get('STARTUP_GATE_REQUESTS', False)
+        self._app = app
+        self.tasks, self.status, self._finished_pid = [], {}, None
+        app.extensions['readiness'] = self
+        app.add_url_rule('/healthz', 'healthz', self.healthz_view)
+        app.add_url_rule('/readyz', 'readyz', self.readyz_view)
+        # Probes come often and from one address; the default per-IP limits would make a healthy instance look down
+        from ..middlewares.extensions import limiter
+        limiter.exempt(self.healthz_view)
+        limiter.exempt(self.readyz_view)
+        app.before_request(self._before_request)
+
+    def add_task(self, name: str, fn, required: bool = True) -> None:
+        self.tasks.append((name, fn, required))
+        self.status[name] = {'done': False, 'required': required, 'attempts': 0, 'error': None, 'ms': None}
+
+    @property
+    def ready(self) -> bool:
+        return all(state['done'] for state in self.status.values() if state['required'])
+
+    def start(self) -> None:
+        """Run pending tasks in the background; a no-op if they already run in this process."""
+        pid = os.getpid()
+        if self._finished_pid == pid or (self._thread_pid == pid and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._finished_pid == pid or (self._thread_pid == pid and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name='startup-tasks', daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+
+    def reset(self) -> None:
+        """Mark every task pending again, e.g. in a forked worker that needs its own connections and listeners."""
+        with self._lock:
+            for state in self.status.values():
+                state.update(done=False, attempts=0, error=None, ms=None)
+            self._finished_pid = None
+
+    def _run(self):
+        with self._app.app_context():
+            for name, fn, required in self.tasks:
+                state = self.status[name]
+                while not state['done']:
+                    state['attempts'] += 1
+                    start = time.perf_counter()
+                    try:
+                        fn()
+                    except Exception as e:
+                        state['error'] = str(e)
+                        if not required:
+                            logger.warning("Startup task %s failed: %s", name, e)
+                            break
+                        logger.warning("Startup task %s failed, retrying in %ss: %s", name, self.retry_interval, e)
+                        time.sleep(self.retry_interval)
+                        continue
+                    state.update(done=True, error=None, ms=round((time.perf_counter() - start) * 1000, 1))
+                    logger.info("Startup task %s finished in %sms", name, state['ms'])
+        self._finished_pid = os.getpid()
+        if self.ready:
+            logger.info("Ready to serve")
+
+    def _before_request(self):
+        self.start()
+        if self.gate_requests and not self.ready and request.endpoint not in ('healthz', 'readyz'):
+            return {'message': 'Service is starting'}, 503, {'Retry-After': str(int(self.retry_interval) or 1)}
+
+    def healthz_view(self):
+        return {'status': 'ok'}, 200
+
+    def readyz_view(self):
+        return {'ready': self.ready, 'tasks': self.status}, 200 if self.ready else 503
+
+
+startup_report = StartupReport()
+readiness = Readiness()
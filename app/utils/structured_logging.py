@@ -0,0 +1,157 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+
+# Redacted wherever they appear in a log message or its arguments
+_SECRET_PATTERNS = [
+    (re.compile(r'(?i)\b(bearer|basic)\s+[A-Za-z0-9._~+/=-]+'), r'\1 [REDACTED]'),
+    (re.compile(r'\beyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*'), '[REDACTED JWT]'),
+]
+
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records below WARNING from chosen loggers.
+
+    ``rates`` maps a logger name to the share of its records to keep, and
+    applies to child loggers too; the most specific name wins. Warnings and
+    errors are never dropped.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._resolved = {}
+
+    def _rate(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, probe = 1.0, name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RedactingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that renders the message on the calling thread, scrubbed of
+    credentials, and hands everything else to the listener thread.
+
+    Rendering here is the only formatting work a request pays for; records
+    that no handler level accepts never get this far.
+    """
+
+    def prepare(self, record):
+        message = redact(record.getMessage())
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args = message, None
+        if record.exc_info:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any ``extra`` fields passed to the log call."""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class LoggingPipeline:
+    """
+    Process-wide logging: callers enqueue records and return, while a
+    background ``QueueListener`` formats and writes them.
+
+    Configured from ``LOG_LEVEL``, ``LOG_FORMAT`` ('json' or 'text') and
+    ``LOG_SAMPLE_RATES``. The listener thread is restarted in forked
+    children, where it would otherwise not exist.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.handler = None
+        self.listener = None
+        self._registered = False
+
+    def init_app(self, app):
+        config = app.config
+        if config.get('LOG_FORMAT', 'json') == 'json':
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(formatter)
+
+        self.stop()
+        self.queue = queue.SimpleQueue()
+        self.handler = RedactingQueueHandler(self.queue)
+        self.handler.addFilter(SamplingFilter(config.get('LOG_SAMPLE_RATES')))
+        self.listener = logging.handlers.QueueListener(self.queue, output, respect_handler_level=True)
+
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(self.handler)
+        root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+        self.listener.start()
+        if not self._registered:
+            atexit.register(self.stop)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._restart_listener)
+            self._registered = True
+
+    def _restart_listener(self):
+        # The listener thread did not survive the fork; records queued by the parent stay with it
+        if self.listener is not None:
+            self.queue = queue.SimpleQueue()
+            self.handler.queue = self.queue
+            self.listener.queue = self.queue
+            self.listener._thread = None
+            self.listener.start()
+
+    def stop(self):
+        """Flush queued records and stop the listener."""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+
+logging_pipeline = LoggingPipeline()
@@ -0,0 +1,43 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Phase name -> [seconds, calls] for the request being handled, None outside requests
+_phases = ContextVar('request_phases', default=None)
+
+
+def start_request():
+    """Begin collecting phase timings for the current request; returns a token for ``end_request``."""
+    return _phases.set({})
+
+
+def end_request(token) -> dict:
+    phases = _phases.get()
+    _phases.reset(token)
+    return phases or {}
+
+
+def record(phase: str, seconds: float) -> None:
+    """Attribute ``seconds`` to ``phase`` of the current request; a no-op outside requests."""
+    phases = _phases.get()
+    if phases is None:
+        return
+    entry = phases.get(phase)
+    if entry is None:
+        phases[phase] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def timed(phase: str):
+    """Time the enclosed block as ``phase`` of the current request."""
+    if _phases.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
@@ -0,0 +1,62 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at ``rate`` tokens per second.
+
+    Holds at most ``capacity`` tokens (defaults to one second's worth), so
+    short bursts are allowed but the long-run rate is capped.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_consume(self, amount: float = 1) -> bool:
+        """Take ``amount`` tokens if they are available right now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return True
+            return False
+
+    def consume(self, amount: float) -> float:
+        """
+        Take ``amount`` tokens, sleeping until the bucket has paid for them.
+
+        The balance may go negative, so callers reporting work after the fact
+        (e.g. bytes already read) are throttled on their next call. Returns the
+        time slept in seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def reset(self, tokens: float, capacity: float = None) -> None:
+        """Set the balance (and optionally the capacity), e.g. after learning the true state elsewhere."""
+        with self._lock:
+            if capacity is not None:
+                self.capacity = float(capacity)
+            self._tokens = min(float(tokens), self.capacity)
+            self._updated = time.monotonic()
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
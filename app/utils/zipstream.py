@@ -0,0 +1,77 @@
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _StreamBuffer:
+    """Write-only, non-seekable sink; ZipFile falls back to data descriptors when it cannot seek."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    Builds a ZIP archive incrementally and hands its bytes out as they are produced.
+
+    Each ``add_*`` method is a generator of byte chunks, so a response can start
+    streaming the first entry while later entries are still being produced.
+    Entries are stored uncompressed by default, which suits media that is
+    already compressed.
+    """
+
+    def __init__(self, compression=zipfile.ZIP_STORED, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self._buffer = _StreamBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, 'w', compression=compression, allowZip64=True)
+
+    def add_file(self, path, arcname=None):
+        info = zipfile.ZipInfo(arcname or os.path.basename(path), time.localtime(os.path.getmtime(path))[:6])
+        info.compress_type = self.compression
+        with open(path, 'rb') as src, self._zip.open(info, 'w', force_zip64=True) as dest:
+            while True:
+                chunk = src.read(self.chunk_size)
+                if not chunk:
+                    break
+                dest.write(chunk)
+                data = self._buffer.drain()
+                if data:
+                    yield data
+        data = self._buffer.drain()
+        if data:
+            yield data
+
+    def add_bytes(self, arcname, payload: bytes):
+        info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        info.compress_type = self.compression
+        self._zip.writestr(info, payload)
+        data = self._buffer.drain()
+        if data:
+            yield data
+
+    def close(self):
+        """Write the central directory and yield the final bytes."""
+        self._zip.close()
+        data = self._buffer.drain()
+        if data:
+            yield data
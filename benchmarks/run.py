@@ -0,0 +1,259 @@
+"""
+Load and micro-benchmarks for the authentication paths.
+
+Boots ``create_app`` against the in-memory stand-ins in ``standins.py`` and
+drives the HTTP endpoints from ``--concurrency`` threads, each with its own
+test client, then times ``UserService`` lookups, ``generate_tokens`` and the
+authorization decorators in a single thread. Every result reports p50, p99,
+mean latency and throughput; the JSON report is written to ``--output``.
+
+Exits with status 1 when a result breaks ``--thresholds`` (absolute limits)
+or regresses more than ``--max-regression`` against ``--baseline`` (an
+earlier report), so it can gate CI.
+
+    python -m benchmarks.run --concurrency 8 --requests 400 --output bench.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import standins
+
+PASSWORD = 'Bench1234'
+
+
+def summarize(latencies, errors, elapsed) -> dict:
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000 if ordered else None
+
+    return {
+        'ops': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(50), 3) if ordered else None,
+        'p99_ms': round(percentile(99), 3) if ordered else None,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3) if ordered else None,
+        'throughput_per_s': round(len(ordered) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+class Session:
+    """One simulated client: a test client and a logged-in user."""
+
+    _addresses = itertools.count(1)
+
+    def __init__(self, app, username):
+        self.client = app.test_client()
+        self.username = username
+        self.new_address()
+        self.login()
+
+    def new_address(self):
+        """Move to a fresh client address, so per-IP rate limits are exercised without rejecting."""
+        n = next(self._addresses)
+        self.client.environ_base['REMOTE_ADDR'] = f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}'
+
+    def login(self):
+        response = self.client.post('/api/auth/login', json={'identifier': self.username, 'password': PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f'Login of {self.username} failed: {response.status_code} {response.get_data(True)}')
+        self.client.set_cookie('access_token_cookie', response.json['data']['access_token'])
+        return response
+
+
+def http_scenarios():
+    counter = itertools.count()
+
+    def register(session, admin):
+        n = next(counter)
+        return session.client.post('/api/auth/register', json={
+            'username': f'bench_new_{os.getpid()}_{n}', 'email': f'bench_new_{os.getpid()}_{n}@example.com',
+            'password': PASSWORD}), 201
+
+    def refresh(session, admin):
+        response = session.client.post('/api/auth/refresh')
+        if response.status_code == 200:
+            session.client.set_cookie('access_token_cookie', response.json['data']['access_token'])
+        return response, 200
+
+    return {
+        'http.login': lambda session, admin: (session.login(), 200),
+        'http.register': register,
+        'http.refresh': refresh,
+        'http.me': lambda session, admin: (session.client.get('/api/auth/me'), 200),
+        'http.protected': lambda session, admin: (session.client.get('/api/protected/resource'), 200),
+        'http.admin': lambda session, admin: (admin.client.get('/api/admin/hashing-stats'), 200),
+    }
+
+
+def run_http(sessions, admins, scenario, total, concurrency) -> dict:
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    per_worker = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+    def worker(index):
+        nonlocal errors
+        session, admin = sessions[index], admins[index]
+        local, failed = [], 0
+        for _ in range(per_worker[index]):
+            session.new_address()
+            admin.new_address()
+            start = time.perf_counter()
+            response, expected = scenario(session, admin)
+            local.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def run_micro(fn, iterations) -> dict:
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        began = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def micro_benchmarks(app, token, iterations) -> dict:
+    from flask_jwt_extended import jwt_required
+    from app.services.user_service import UserService
+    from app.utils.permissions import Permission
+    from app.utils.security import generate_tokens, permissions_required, role_required
+
+    def endpoint():
+        return 'ok'
+
+    guarded_by_role = jwt_required()(role_required('admin')(endpoint))
+    guarded_by_permission = permissions_required(all_of=[Permission.VIEW_STATS])(endpoint)
+    headers = {'Cookie': f'access_token_cookie={token}'}
+
+    def in_request(view):
+        def call():
+            with app.test_request_context('/', headers=headers):
+                view()
+        return call
+
+    with app.app_context():
+        user = UserService.get_user_by_username_or_email('bench_admin')
+        return {
+            'micro.user_lookup': run_micro(lambda: UserService.get_user_by_username_or_email('bench_admin'),
+                                           iterations),
+            'micro.generate_tokens': run_micro(lambda: generate_tokens(user), iterations),
+            'micro.role_required': run_micro(in_request(guarded_by_role), iterations),
+            'micro.permissions_required': run_micro(in_request(guarded_by_permission), iterations),
+        }
+
+
+def check(results, thresholds, baseline, max_regression) -> list:
+    violations = []
+    for name, limits in (thresholds or {}).items():
+        result = results.get(name)
+        if result is None:
+            continue
+        if result['errors']:
+            violations.append(f'{name}: {result["errors"]} failed operations')
+        if 'p99_ms' in limits and result['p99_ms'] is not None and result['p99_ms'] > limits['p99_ms']:
+            violations.append(f'{name}: p99 {result["p99_ms"]}ms exceeds {limits["p99_ms"]}ms')
+        if 'p50_ms' in limits and result['p50_ms'] is not None and result['p50_ms'] > limits['p50_ms']:
+            violations.append(f'{name}: p50 {result["p50_ms"]}ms exceeds {limits["p50_ms"]}ms')
+        if 'min_throughput_per_s' in limits and (result['throughput_per_s'] or 0) < limits['min_throughput_per_s']:
+            violations.append(f'{name}: throughput {result["throughput_per_s"]}/s below '
+                              f'{limits["min_throughput_per_s"]}/s')
+    for name, previous in (baseline or {}).items():
+        result = results.get(name)
+        if result is None or not previous.get('p50_ms') or result['p50_ms'] is None:
+            continue
+        if result['p50_ms'] > previous['p50_ms'] * (1 + max_regression):
+            violations.append(f'{name}: p50 {result["p50_ms"]}ms regressed from {previous["p50_ms"]}ms')
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads for HTTP scenarios')
+    parser.add_argument('--requests', type=int, default=400, help='Requests per HTTP scenario')
+    parser.add_argument('--iterations', type=int, default=2000, help='Calls per micro-benchmark')
+    parser.add_argument('--only', nargs='*', help='Run only these benchmarks, e.g. http.login micro.user_lookup')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    parser.add_argument('--thresholds', help='JSON file of absolute limits per benchmark')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare p50 latencies against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Allowed p50 slowdown against the baseline, as a fraction (default 0.25)')
+    args = parser.parse_args(argv)
+
+    standins.install()
+    from app import create_app
+    from app.services.user_service import UserService
+
+    app = create_app()
+    with app.app_context():
+        for i in range(args.concurrency):
+            UserService.create_user(f'bench_user_{i}', f'bench_user_{i}@example.com', PASSWORD)
+        UserService.create_user('bench_admin', 'bench_admin@example.com', PASSWORD)
+        UserService.update_role('bench_admin', 'admin')
+
+    sessions = [Session(app, f'bench_user_{i}') for i in range(args.concurrency)]
+    admins = [Session(app, 'bench_admin') for _ in range(args.concurrency)]
+    wanted = set(args.only or [])
+
+    results = {}
+    for name, scenario in http_scenarios().items():
+        if not wanted or name in wanted:
+            results[name] = run_http(sessions, admins, scenario, args.requests, args.concurrency)
+    micro = micro_benchmarks(app, admins[0].client.get_cookie('access_token_cookie').value, args.iterations)
+    results.update({name: result for name, result in micro.items() if not wanted or name in wanted})
+
+    thresholds = baseline = None
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    violations = check(results, thresholds, baseline, args.max_regression)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'iterations': args.iterations,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+        'violations': violations,
+    }
+    rendered = json.dumps(report, indent=2)
+    print(rendered)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(rendered + '\n')
+    for violation in violations:
+        print(f'THRESHOLD: {violation}', file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
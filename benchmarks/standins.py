@@ -0,0 +1,40 @@
+"""
+In-memory stand-ins for MongoDB and Redis, so ``create_app`` can be booted
+anywhere the benchmark requirements are installed.
+
+Redis is a ``fakeredis`` server (with Lua, for the app's scripts) shared by
+every client the app creates; MongoDB is ``mongomock``. Neither models
+network latency, so the numbers measure the application's own cost.
+"""
+import os
+
+import fakeredis
+import mongoengine
+import mongomock
+
+server = fakeredis.FakeServer()
+
+
+def _connect(*args, **kwargs):
+    kwargs.pop('host', None)
+    return mongoengine.connection.connect('flask_api', host='mongodb://localhost',
+                                          mongo_client_class=mongomock.MongoClient, **kwargs)
+
+
+def install():
+    """Patch the app's Mongo and Redis entry points; call before ``create_app``."""
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-jwt-secret')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app.utils import redis_pool
+
+    def from_url(cls, url, **kwargs):
+        for option in ('socket_timeout', 'socket_connect_timeout', 'socket_keepalive', 'health_check_interval'):
+            kwargs.pop(option, None)
+        return cls(connection_class=fakeredis.FakeConnection, server=server, **kwargs)
+
+    redis_pool.InstrumentedConnectionPool.from_url = classmethod(from_url)
+
+    import app as app_package
+    app_package.connect = _connect
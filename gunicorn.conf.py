@@ -0,0 +1,60 @@
+"""
+Production gunicorn settings: gunicorn --config gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment. Preloading imports
+the app once in the master so workers share its memory copy-on-write; the
+app then opens no connections and runs no startup work until it has been
+forked (see ``post_fork``).
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# sync: one request per worker. gthread: a thread pool per worker, for the
+# I/O-bound Mongo/Redis calls of this API. gevent: greenlets, needs gevent installed.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))  # gthread only
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))  # gevent only
+
+# gevent must monkey-patch before the app imports socket and threading, which a preloading master already did
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false' if worker_class == 'gevent' else 'true').lower() == 'true'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))  # Kills a worker silent this long; above PASSWORD_HASH_TIMEOUT
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))  # Time to finish in-flight requests on restart
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))  # Seconds an idle keep-alive connection is held open
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))  # Recycle workers to bound memory growth
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))  # Spread recycling across workers
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None  # Heartbeat file off the container overlay fs
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')  # The app logs requests itself; '-' for gunicorn's access log too
+errorlog = '-'
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# Set before the app is imported, so the master and every worker see them
+os.environ['WEB_CONCURRENCY'] = str(workers)  # Splits the local rate limit budgets, see RATELIMIT_HYBRID_WORKERS
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'flask_jwt_metrics'))
+if preload_app:
+    os.environ.setdefault('STARTUP_DEFER_TASKS', 'true')
+
+
+def on_starting(server):
+    # Metrics of a previous run's workers would be merged into /metrics
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], 'metrics_*.json')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import reinit_after_fork
+        from wsgi import app
+        reinit_after_fork(app)
+
+
+def worker_exit(server, worker):
+    # Fold this worker's counters into the retired-workers file, so recycled workers leave no files behind
+    from app.middlewares.instrumentation import instrumentation
+    instrumentation.retire()
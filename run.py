@@ -1,8 +1,12 @@
 import os
 from app import create_app
 
-app = create_app()
+# Password hashing workers (forkserver/spawn) re-import the main module as __mp_main__; they need no app
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
+    # Development server only; production runs gunicorn with gunicorn.conf.py
     port = int(os.environ.get('PORT', 8080))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    debug = os.environ.get('FLASK_DEBUG', 'false').lower() in ('1', 'true')
+    app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,68 @@
+"""
+Boots one app for the whole run against the in-memory MongoDB and Redis of
+``benchmarks.standins``. Tests share it, so each one works with its own
+users and client address rather than resetting the stores.
+"""
+import itertools
+import os
+import tempfile
+import time
+import uuid
+
+import pytest
+
+from benchmarks import standins
+
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')  # Hash inline rather than in a process pool
+os.environ.setdefault('DOWNLOAD_FOLDER', tempfile.mkdtemp(prefix='flask-api-tests-'))
+standins.install()
+
+PASSWORD = 'Passw0rd!'
+
+_addresses = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    from app.utils.startup import readiness
+
+    app = create_app()
+    app.config['TESTING'] = True
+    deadline = time.monotonic() + 30
+    while not readiness.ready:
+        if time.monotonic() > deadline:
+            pytest.fail(f"App did not become ready: {readiness.status}")
+        time.sleep(0.05)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """A test client with an address of its own, so per-IP limits and lockouts do not carry over."""
+    client = app.test_client()
+    n = next(_addresses)
+    client.environ_base['REMOTE_ADDR'] = f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}'
+    return client
+
+
+@pytest.fixture
+def user(client):
+    """A freshly registered user: ``(username, password)``."""
+    username = f'user_{uuid.uuid4().hex[:12]}'
+    response = client.post('/api/auth/register',
+                           json={'username': username, 'email': f'{username}@example.com', 'password': PASSWORD})
+    assert response.status_code == 201, response.get_data(True)
+    client.delete_cookie('refresh_token_cookie')
+    return username, PASSWORD
+
+
+@pytest.fixture
+def login(client):
+    """Log ``client`` in, keeping the access token as a cookie like a browser would."""
+    def login(identifier, password=PASSWORD):
+        response = client.post('/api/auth/login', json={'identifier': identifier, 'password': password})
+        if response.status_code == 200:
+            client.set_cookie('access_token_cookie', response.json['data']['access_token'])
+        return response
+    return login
@@ -0,0 +1,110 @@
+import time
+import uuid
+
+from app.services.user_service import UserService
+
+from .conftest import PASSWORD
+
+
+def test_register_rejects_chosen_role(client, login):
+    username = f'user_{uuid.uuid4().hex[:12]}'
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': PASSWORD, 'role': 'admin'})
+
+    assert response.status_code == 400
+    assert response.json['message'] == "Role cannot be chosen at registration"
+    assert login(username).status_code == 401
+
+
+def test_register_accepts_user_role(client):
+    username = f'user_{uuid.uuid4().hex[:12]}'
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': PASSWORD, 'role': 'user'})
+
+    assert response.status_code == 201
+
+
+def test_login_locks_out_after_repeated_failures(app, user, login):
+    username, password = user
+    for _ in range(app.config['LOGIN_MAX_ATTEMPTS']):
+        assert login(username, 'wrong-password').status_code == 401
+
+    response = login(username, password)
+
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= app.config['LOGIN_ATTEMPT_WINDOW']
+
+
+def test_successful_login_clears_failures(app, user, login):
+    username, password = user
+    for _ in range(app.config['LOGIN_MAX_ATTEMPTS'] - 1):
+        login(username, 'wrong-password')
+    assert login(username, password).status_code == 200
+
+    for _ in range(app.config['LOGIN_MAX_ATTEMPTS'] - 1):
+        assert login(username, 'wrong-password').status_code == 401
+    assert login(username, password).status_code == 200
+
+
+def test_refresh_rotates_the_refresh_token(client, user, login):
+    login(user[0])
+    first = client.get_cookie('refresh_token_cookie').value
+
+    response = client.post('/api/auth/refresh')
+
+    assert response.status_code == 200
+    assert client.get_cookie('refresh_token_cookie').value != first
+
+
+def test_concurrent_refresh_within_grace_keeps_the_family(client, user, login):
+    login(user[0])
+    first = client.get_cookie('refresh_token_cookie').value
+    assert client.post('/api/auth/refresh').status_code == 200
+    second = client.get_cookie('refresh_token_cookie').value
+
+    client.set_cookie('refresh_token_cookie', first)
+    response = client.post('/api/auth/refresh')
+    assert response.status_code == 401
+    assert response.json['message'] == "Refresh token already used"
+
+    client.set_cookie('refresh_token_cookie', second)
+    assert client.post('/api/auth/refresh').status_code == 200
+
+
+def test_refresh_token_reuse_revokes_the_family(app, client, user, login, monkeypatch):
+    login(user[0])
+    first = client.get_cookie('refresh_token_cookie').value
+    assert client.post('/api/auth/refresh').status_code == 200
+    second = client.get_cookie('refresh_token_cookie').value
+
+    later = time.time() + app.config['JWT_REFRESH_REUSE_GRACE'] + 1
+    monkeypatch.setattr(time, 'time', lambda: later)
+    client.set_cookie('refresh_token_cookie', first)
+    response = client.post('/api/auth/refresh')
+    assert response.status_code == 401
+    assert response.json['message'] == "Refresh token reuse detected"
+
+    # The token issued in the replayed one's place is gone with its family
+    client.set_cookie('refresh_token_cookie', second)
+    assert client.post('/api/auth/refresh').status_code == 401
+
+
+def test_role_change_makes_claims_stale_until_refresh(app, client, user, login):
+    username = user[0]
+    login(username)
+    assert client.get('/api/auth/me').status_code == 200
+    assert client.get('/api/protected/admin').status_code == 403
+
+    with app.app_context():
+        UserService.update_role(username, 'admin')
+
+    response = client.get('/api/auth/me')
+    assert response.status_code == 401
+    assert response.json['message'] == "Token claims are stale, please refresh"
+    assert client.get('/api/protected/admin').status_code == 401
+
+    refreshed = client.post('/api/auth/refresh')
+    assert refreshed.status_code == 200
+    client.set_cookie('access_token_cookie', refreshed.json['data']['access_token'])
+    assert client.get('/api/auth/me').status_code == 200
+    assert client.get('/api/protected/admin').status_code == 200
@@ -0,0 +1,46 @@
+import time
+import uuid
+
+import pytest
+
+from app.services.download_jobs import FAILED, QUEUED, JobLimitError, download_jobs
+
+
+@pytest.fixture
+def jobs(app, monkeypatch):
+    monkeypatch.setattr(download_jobs, '_run', lambda *args: None)  # Queue only; nothing is downloaded
+    with app.app_context():
+        yield download_jobs
+
+
+@pytest.fixture
+def owner():
+    return f'user_{uuid.uuid4().hex[:12]}'
+
+
+def test_submit_limits_active_jobs_per_owner(app, jobs, owner):
+    job_ids = [jobs.submit(owner, 'video', 'https://example.com/watch') for _ in range(app.config['DOWNLOAD_JOB_USER_LIMIT'])]
+
+    with pytest.raises(JobLimitError):
+        jobs.submit(owner, 'video', 'https://example.com/watch')
+    # Other owners are not affected
+    jobs.submit(f'{owner}_other', 'video', 'https://example.com/watch')
+
+    job = jobs.get(job_ids[0])
+    assert job['owner'] == owner
+    assert job['status'] == QUEUED
+
+
+def test_jobs_of_a_dead_worker_stop_counting(app, jobs, owner, monkeypatch):
+    job_ids = [jobs.submit(owner, 'video', 'https://example.com/watch') for _ in range(app.config['DOWNLOAD_JOB_USER_LIMIT'])]
+
+    later = time.time() + app.config['DOWNLOAD_JOB_STALE_AFTER'] + 1
+    monkeypatch.setattr(time, 'time', lambda: later)
+
+    assert jobs.get(job_ids[0])['status'] == FAILED
+    jobs.submit(owner, 'video', 'https://example.com/watch')
+
+
+def test_submit_rejects_unknown_kinds(jobs, owner):
+    with pytest.raises(ValueError):
+        jobs.submit(owner, 'podcast', 'https://example.com/feed')
@@ -0,0 +1,44 @@
+import uuid
+
+import pytest
+
+from app.middlewares.hybrid_limits import HybridRedisStorage
+from app.utils.redis_pool import redis_pool
+
+
+@pytest.fixture
+def key():
+    return f'test/{uuid.uuid4().hex}'
+
+
+def make_storage(**options):
+    """A storage like one worker's, syncing only when told to."""
+    return HybridRedisStorage('hybrid+redis://', connection_pool=redis_pool.pool, hybrid_sync_interval=3600, **options)
+
+
+def test_workers_sharing_a_limit_never_exceed_it(app, key):
+    storages = [make_storage(hybrid_workers=3) for _ in range(3)]
+
+    admitted = sum(storage.acquire_entry(key, 60, 60) for _ in range(60) for storage in storages)
+
+    assert admitted == 60
+
+
+def test_sync_records_locally_admitted_hits(app, key):
+    worker, other = make_storage(), make_storage()
+    for _ in range(30):
+        assert worker.acquire_entry(key, 100, 60)
+    assert other.get_moving_window(key, 100, 60)[1] < 30
+
+    worker.sync()
+
+    assert other.get_moving_window(key, 100, 60)[1] == 30
+
+
+def test_small_limits_are_checked_in_redis(app, key):
+    worker, other = make_storage(hybrid_min_limit=10), make_storage(hybrid_min_limit=10)
+    for _ in range(5):
+        assert worker.acquire_entry(key, 5, 60)
+
+    assert other.get_moving_window(key, 5, 60)[1] == 5
+    assert not other.acquire_entry(key, 5, 60)
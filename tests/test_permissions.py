@@ -0,0 +1,28 @@
+import pytest
+
+from app.utils.permissions import ALL_PERMISSIONS, Permission, compile_permissions, permission_names, permission_registry
+
+
+def test_compile_permissions_accepts_names_members_and_wildcard():
+    assert compile_permissions(['manage_users', Permission.VIEW_STATS]) == Permission.MANAGE_USERS | Permission.VIEW_STATS
+    assert compile_permissions('*') == ALL_PERMISSIONS
+    assert compile_permissions([]) == 0
+
+
+def test_compile_permissions_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        compile_permissions(['delete_everything'])
+
+
+def test_permission_names_round_trip():
+    mask = compile_permissions(['admin_access', 'view_stats'])
+
+    assert permission_names(mask) == ['admin_access', 'view_stats']
+
+
+def test_role_masks(app):
+    assert permission_registry.mask_for_role('admin') == ALL_PERMISSIONS
+    assert permission_registry.mask_for_role('user') == 0
+    assert permission_registry.mask_for_role('superuser') == 0
+    assert permission_registry.is_role('user')
+    assert not permission_registry.is_role('superuser')
@@ -0,0 +1,64 @@
+import uuid
+
+import pytest
+
+from app.services.user_cache import user_cache
+from app.services.user_service import UserService
+
+from .conftest import PASSWORD
+
+
+@pytest.fixture
+def name():
+    return f'user_{uuid.uuid4().hex[:12]}'
+
+
+def test_lookup_ignores_case(app, name):
+    with app.app_context():
+        UserService.create_user(name, f'{name}@example.com', PASSWORD)
+
+        assert UserService.get_user_by_username_or_email(name.upper()).username == name
+        assert UserService.get_user_by_username_or_email(f'{name}@EXAMPLE.com').username == name
+
+
+def test_missing_user_is_found_once_registered(app, client, name):
+    with app.app_context():
+        assert UserService.get_user_by_username_or_email(name) is None
+
+    response = client.post('/api/auth/register',
+                           json={'username': name, 'email': f'{name}@example.com', 'password': PASSWORD})
+    assert response.status_code == 201
+
+    with app.app_context():
+        assert UserService.get_user_by_username_or_email(name).username == name
+
+
+def test_miss_read_before_a_registration_is_not_recorded(app, name):
+    with app.app_context():
+        generation = user_cache.generation()
+        assert generation is not None
+        UserService.create_user(name, f'{name}@example.com', PASSWORD)
+
+        # A lookup that raced the registration must not hide the new user
+        user_cache.set_missing(name, generation)
+
+        assert user_cache.get(name) is not None
+        assert UserService.get_user_by_username_or_email(name).username == name
+
+
+def test_role_change_reaches_cached_lookups(app, name):
+    with app.app_context():
+        UserService.create_user(name, f'{name}@example.com', PASSWORD)
+        assert UserService.get_user_by_username_or_email(name).role == 'user'
+
+        UserService.update_role(name, 'admin')
+
+        assert UserService.get_user_by_username_or_email(name).role == 'admin'
+
+
+def test_unknown_role_is_refused(app, name):
+    with app.app_context():
+        UserService.create_user(name, f'{name}@example.com', PASSWORD)
+
+        with pytest.raises(ValueError):
+            UserService.update_role(name, 'superuser')